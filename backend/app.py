@@ -1,12 +1,13 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, insert
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 
 from config import Config
-from db import db
+from db import db, init_read_routing, use_shard
 from models.users import User
 from models.plans import Plan
 from models.subscriptions import Subscription
@@ -14,33 +15,82 @@ from models.usage import Usage
 from models.discounts import Discount
 from models.audit_logs import AuditLog
 from models.alerts import Alert
+from models.analytics_reports import AnalyticsReport
+from models.broadcasts import Broadcast
+
+from utils.cache import dashboard_cache, invalidate_user_dashboard
+from utils.rate_limit import login_limiter
+from utils.pubsub import alert_hub
+from utils.jobs import Job
+from utils.profiler import profiler
+from utils.replicas import add_sqlite_replica_binds, init_sqlite_replica_refresh, refresh_sqlite_replicas
+from utils.sharding import (
+    create_shard_tables, each_shard, init_sharding, seed_email_registry, seed_user_id_sequence,
+    shard_key_for_email, shard_keys, sync_global_tables, user_shard_key
+)
+
+from services.analytics_service import build_cohort_report
+from services.lifecycle_service import run_subscription_lifecycle
 
 from routes.admin_routes import admin_bp
 from routes.user_routes import user_bp
 
-def create_app():
+def create_app(test_config=None):
     app = Flask(__name__)
     app.config.from_object(Config)
+    if test_config:
+        app.config.update(test_config)
+    add_sqlite_replica_binds(app, app.config['SQLITE_REPLICA_COUNT'])
     
     # Initialize extensions
     db.init_app(app)
+    init_read_routing(app)
+    init_sharding(app)
+    dashboard_cache.ttl_seconds = app.config['DASHBOARD_CACHE_TTL']
+    login_limiter.init_app(app)
+    profiler.init_app(app)
     CORS(app, origins=['http://localhost:3000', 'http://127.0.0.1:3000'], supports_credentials=True)
     
     # Register blueprints
     app.register_blueprint(admin_bp, url_prefix='/admin')
     app.register_blueprint(user_bp, url_prefix='/user')
     
+    @app.cli.command('build-analytics-report')
+    def build_analytics_report_command():
+        """Rebuild the cohort retention and churn report served by /admin/analytics."""
+        print(build_cohort_report(workers=app.config['ANALYTICS_WORKERS']))
+    
+    @app.cli.command('run-subscription-lifecycle')
+    def run_subscription_lifecycle_command():
+        """Expire or renew subscriptions whose end_date has passed."""
+        job = Job('subscription_lifecycle')
+        print(run_subscription_lifecycle(job, auto_renew=app.config['SUBSCRIPTION_AUTO_RENEW']))
+    
     # Create tables and insert demo data
     with app.app_context():
-        db.create_all()
+        # Only the primary here: shard and replica binds are populated separately
+        db.create_all(bind_key=None)
+        create_shard_tables()
+        seed_user_id_sequence()
+        seed_email_registry()
         create_demo_data()
+        refresh_sqlite_replicas(app)
+        init_sqlite_replica_refresh(app, app.config['SQLITE_REPLICA_LAG_SECONDS'])
     
     return app
 
+def _find_demo_user(email):
+    shard_key = shard_key_for_email(email)
+    # An email missing from the registry has no user on any shard
+    if shard_key is None and shard_keys():
+        return None
+    with use_shard(shard_key):
+        return User.query.filter_by(email=email).first()
+
 def create_demo_data():
     """Create demo admin and user if they don't exist"""
     # Create demo admin user
-    admin_user = User.query.filter_by(email='admin@example.com').first()
+    admin_user = _find_demo_user('admin@example.com')
     if not admin_user:
         admin_user = User(
             name='Admin User',
@@ -52,7 +102,7 @@ def create_demo_data():
         print("Demo admin user created: admin@example.com / admin123")
     
     # Create demo regular user
-    demo_user = User.query.filter_by(email='user@example.com').first()
+    demo_user = _find_demo_user('user@example.com')
     if not demo_user:
         demo_user = User(
             name='Demo User',
@@ -186,13 +236,20 @@ def create_demo_data():
         db.session.add(unlimited_plan)
         print("Demo Unlimited Plan created")
     
+    # Shards need the plans before anything references them
+    demo_user_id = demo_user.id if demo_user else None
+    basic_plan_id = basic_plan.id if basic_plan else None
+    db.session.commit()
+    sync_global_tables()
+    
     # Create demo subscription for the user
-    if demo_user and basic_plan:
-        demo_subscription = Subscription.query.filter_by(user_id=demo_user.id).first()
+    if demo_user_id and basic_plan_id:
+        with use_shard(user_shard_key(demo_user_id)):
+            demo_subscription = Subscription.query.filter_by(user_id=demo_user_id).first()
         if not demo_subscription:
             demo_subscription = Subscription(
-                user_id=demo_user.id,
-                plan_id=basic_plan.id,
+                user_id=demo_user_id,
+                plan_id=basic_plan_id,
                 status='active',
                 start_date=datetime.now().date(),
                 end_date=None,
@@ -214,31 +271,68 @@ def create_expiry_alerts():
     # Calculate date 2 days from now
     alert_date = datetime.now().date() + timedelta(days=2)
     
-    # Find subscriptions expiring in 2 days
-    expiring_subscriptions = Subscription.query.filter(
+    for shard_key in each_shard():
+        with use_shard(shard_key):
+            for alert in _create_shard_expiry_alerts(alert_date):
+                alert_hub.publish_alert(alert)
+
+def _create_shard_expiry_alerts(alert_date):
+    # Find subscriptions expiring in 2 days together with their plan names
+    expiring_subscriptions = db.session.query(
+        Subscription.user_id, Subscription.end_date, Plan.name
+    ).join(Plan, Plan.id == Subscription.plan_id).filter(
         Subscription.end_date == alert_date,
         Subscription.status == 'active'
     ).all()
+    if not expiring_subscriptions:
+        return []
     
-    for subscription in expiring_subscriptions:
-        # Check if alert already exists for this subscription
-        existing_alert = Alert.query.filter_by(
-            user_id=subscription.user_id,
-            message__like='%Plan Expiring Soon%'
-        ).first()
-        
-        if not existing_alert:
-            alert = Alert(
-                user_id=subscription.user_id,
-                title='Plan Expiring Soon',
-                type='plan_expiry',
-                message=f'Your {subscription.plan.name} plan will expire on {subscription.end_date}. Please renew to continue service.',
-                is_read=False
-            )
-            db.session.add(alert)
-            print(f"Created expiry alert for user {subscription.user_id}")
+    # Check which users were already warned this cycle in one query rather than one per subscription;
+    # a week back reaches today's run but not the warning before last month's end date
+    cycle_cutoff = datetime.combine(alert_date - timedelta(days=7), datetime.min.time())
+    alerted_users = {user_id for (user_id,) in db.session.query(Alert.user_id).filter(
+        Alert.user_id.in_([row.user_id for row in expiring_subscriptions]),
+        Alert.title == 'Plan Expiring Soon',
+        Alert.created_at >= cycle_cutoff
+    )}
+    
+    now = datetime.utcnow()
+    new_alerts = []
+    for user_id, end_date, plan_name in expiring_subscriptions:
+        if user_id not in alerted_users:
+            new_alerts.append({
+                'user_id': user_id,
+                'title': 'Plan Expiring Soon',
+                'type': 'plan_expiry',
+                'message': f'Your {plan_name} plan will expire on {end_date}. Please renew to continue service.',
+                'is_read': False,
+                'created_at': now
+            })
+            alerted_users.add(user_id)
+            invalidate_user_dashboard(user_id)
+            print(f"Created expiry alert for user {user_id}")
+    if not new_alerts:
+        return []
     
+    first_alert_id = None
+    if alert_hub.subscriber_count():
+        first_alert_id = db.session.query(func.coalesce(func.max(Alert.id), 0)).scalar()
+    
+    # One multi-row insert instead of a flush per alert
+    db.session.execute(insert(Alert.__table__), new_alerts)
     db.session.commit()
+    
+    if first_alert_id is None:
+        return []
+    listening = alert_hub.subscribed_user_ids() & {alert['user_id'] for alert in new_alerts}
+    if not listening:
+        return []
+    # Matched on content: MySQL rounds DATETIME, so created_at may no longer equal now
+    return Alert.query.filter(
+        Alert.id > first_alert_id,
+        Alert.user_id.in_(sorted(listening)),
+        Alert.title == 'Plan Expiring Soon'
+    ).all()
 
 if __name__ == '__main__':
     app = create_app()
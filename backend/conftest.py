@@ -0,0 +1,60 @@
+import contextlib
+import threading
+
+import pytest
+from sqlalchemy import event
+
+from app import create_app
+from db import db
+from utils.cache import dashboard_cache
+
+
+@pytest.fixture
+def app():
+    """Fresh app on an in-memory SQLite database holding only the demo data"""
+    dashboard_cache.clear()
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'SQLALCHEMY_BINDS': {},
+        'SQLITE_REPLICA_COUNT': 0,
+        'RATELIMIT_ENABLED': False
+    })
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def max_queries(app):
+    """Context manager failing the test when the block runs more than budget SQL statements
+
+    Only statements issued on the calling thread count, so background jobs a
+    request starts do not make the request's budget flaky.
+    """
+    with app.app_context():
+        engines = list(db.engines.values())
+
+    @contextlib.contextmanager
+    def guard(budget):
+        thread_id = threading.get_ident()
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if threading.get_ident() == thread_id:
+                statements.append(statement)
+
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            for engine in engines:
+                event.remove(engine, 'before_cursor_execute', record)
+
+        assert len(statements) <= budget, (
+            f'{len(statements)} SQL statements, budget is {budget}:\n' + '\n'.join(statements)
+        )
+
+    return guard
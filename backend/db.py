@@ -1,3 +1,204 @@
+import contextlib
+import contextvars
+import random
+import time
+import zlib
+from flask import current_app, g, has_app_context, has_request_context, request
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import inspect
+from sqlalchemy.sql.util import find_tables
 
-db = SQLAlchemy()
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+REPLICA_BIND_PREFIX = 'replica_'
+SHARD_BIND_PREFIX = 'shard_'
+
+# Tables partitioned by user_id; plans and discounts are copied to every shard
+SHARDED_TABLES = frozenset(['users', 'subscriptions', 'usage', 'alerts', 'audit_logs'])
+
+# Carries "user_id:expiry" so the client's next reads stay on the primary whichever worker serves them
+RECENT_WRITE_COOKIE = 'recent_write'
+
+_shard_override = contextvars.ContextVar('shard_override', default=None)
+
+
+class RoutingSession(Session):
+    """Session that routes user-scoped tables to their shard, reads to replicas and writes to the primary"""
+
+    def __init__(self, db, **kwargs):
+        super().__init__(db, **kwargs)
+        self._shard_keys = shard_bind_keys(current_app)
+        if self._shard_keys:
+            # Flushes pick a connection per instance, so one commit may span shards
+            self.connection_callable = self._connection_for_instance
+
+    def get_bind(self, mapper=None, clause=None, bind=None, shard_key=None, **kwargs):
+        if bind is None:
+            if shard_key is None and self._shard_keys and _touches_sharded_table(mapper, clause):
+                shard_key = current_shard()
+                if shard_key is None:
+                    # Guessing a shard would read or write the wrong user's partition
+                    raise RuntimeError(
+                        'No shard chosen for a query on a sharded table; '
+                        'name the user in the request or wrap it in use_shard()'
+                    )
+            if shard_key is not None:
+                return self._db.engines[shard_key]
+
+            if not self._flushing and not getattr(clause, 'is_dml', False):
+                replica = _request_replica()
+                if replica is not None:
+                    return self._db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _connection_for_instance(self, mapper, instance):
+        shard_key = None
+        if mapper.local_table.name in SHARDED_TABLES:
+            shard_key = self._shard_key_for_instance(instance)
+        return self.get_transaction().connection(mapper, shard_key=shard_key)
+
+    def _shard_key_for_instance(self, instance):
+        table_name = type(instance).__tablename__
+        if table_name == 'users':
+            if instance.id is None:
+                # Shards cannot share an autoincrement, so new users draw ids from the primary
+                from utils.sharding import allocate_user_id
+                instance.id = allocate_user_id(self.get_transaction().connection(None), instance.email)
+            shard_key = shard_key_for_user(instance.id, self._shard_keys)
+            # A request that signs a user up keeps reading from that user's shard, not the
+            # one its unregistered email was looked up on
+            if has_request_context():
+                g.shard_key = shard_key
+            return shard_key
+        if getattr(instance, 'user_id', None) is not None:
+            return shard_key_for_user(instance.user_id, self._shard_keys)
+        # Rows owned by no user, such as audit logs of jobs started without an admin, live on the first shard
+        return current_shard() or self._shard_keys[0]
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def _touches_sharded_table(mapper, clause):
+    if mapper is not None:
+        return inspect(mapper).local_table.name in SHARDED_TABLES
+    if clause is not None:
+        return any(
+            table.name in SHARDED_TABLES
+            for table in find_tables(clause, include_aliases=True, include_crud=True)
+        )
+    return False
+
+
+def _request_replica():
+    if not has_request_context():
+        return None
+    return g.get('db_replica')
+
+
+def request_user_id():
+    """Return the acting user's id from the User-ID header, a user_id query parameter or JSON field"""
+    # EventSource cannot send headers, so alert streams name the user in the query string
+    user_id = request.headers.get('User-ID') or request.args.get('user_id')
+    if not user_id:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            user_id = data.get('user_id')
+    try:
+        return int(user_id) if user_id else None
+    except (TypeError, ValueError):
+        return None
+
+
+def remember_user_write(user_id):
+    """Keep user_id on the primary after this request even though the request did not name them"""
+    if has_request_context():
+        g.written_user_id = int(user_id)
+
+
+def _bind_keys(app, prefix):
+    return sorted(
+        (key for key in (app.config.get('SQLALCHEMY_BINDS') or {}) if key.startswith(prefix)),
+        key=lambda key: int(key[len(prefix):])
+    )
+
+
+def replica_bind_keys(app):
+    return _bind_keys(app, REPLICA_BIND_PREFIX)
+
+
+def shard_bind_keys(app):
+    return _bind_keys(app, SHARD_BIND_PREFIX)
+
+
+def shard_key_for_user(user_id, shard_keys):
+    """Hash-partition a user id onto one of the shard bind keys"""
+    return shard_keys[zlib.crc32(str(int(user_id)).encode()) % len(shard_keys)]
+
+
+def current_shard():
+    """Shard selected by use_shard(), else the one chosen for the current request"""
+    shard_key = _shard_override.get()
+    if shard_key is None and has_app_context():
+        shard_key = g.get('shard_key')
+        if shard_key is None and g.get('shard_email'):
+            # Resolved on first use so throttled logins never pay for the lookup
+            from utils.sharding import shard_key_for_email
+            shard_key = shard_key_for_email(g.pop('shard_email'))
+            if shard_key is None:
+                # Nobody has the email, so its lookups find no row on whichever shard answers
+                shard_key = shard_bind_keys(current_app)[0]
+            g.shard_key = shard_key
+    return shard_key
+
+
+@contextlib.contextmanager
+def use_shard(shard_key):
+    """Route user-scoped tables to shard_key inside the block; None leaves routing unchanged"""
+    token = _shard_override.set(shard_key or _shard_override.get())
+    try:
+        yield
+    finally:
+        _shard_override.reset(token)
+
+
+def _recent_writer(cookie):
+    """User id from a recent-write cookie that has not expired yet"""
+    try:
+        user_id, expires_at = cookie.split(':')
+        return int(user_id) if float(expires_at) > time.time() else None
+    except (AttributeError, ValueError):
+        return None
+
+
+def init_read_routing(app):
+    """Pick a replica for each read-only request, keeping recent writers on the primary
+
+    The last write travels with the client in a short-lived cookie rather than
+    in worker memory, so the read after a write stays on the primary even when
+    another worker process or host serves it.
+    """
+    replicas = replica_bind_keys(app)
+    if not replicas:
+        return
+
+    @app.before_request
+    def choose_replica():
+        g.db_replica = None
+        if request.method in READ_METHODS:
+            user_id = request_user_id()
+            if user_id is None or _recent_writer(request.cookies.get(RECENT_WRITE_COOKIE)) != user_id:
+                g.db_replica = random.choice(replicas)
+
+    @app.after_request
+    def remember_writer(response):
+        if request.method not in READ_METHODS and response.status_code < 400:
+            # Signups only learn their user's id from the insert
+            user_id = g.get('written_user_id') or request_user_id()
+            if user_id is not None:
+                seconds = app.config['READ_YOUR_WRITES_SECONDS']
+                response.set_cookie(
+                    RECENT_WRITE_COOKIE, f'{user_id}:{time.time() + seconds}',
+                    max_age=seconds, httponly=True, samesite='Lax'
+                )
+        return response
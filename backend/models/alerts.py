@@ -11,14 +11,19 @@ class Alert(db.Model):
     type = db.Column(db.Enum('usage_warning', 'billing_reminder', 'plan_expiry', 'system', name='alert_type'), nullable=False)
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Broadcast alerts may leave message empty and share their broadcast's body
+    broadcast_id = db.Column(db.Integer, db.ForeignKey('broadcasts.id'))
+    
+    broadcast = db.relationship('Broadcast', lazy='joined')
     
     def to_dict(self):
         return {
             'id': self.id,
             'user_id': self.user_id,
             'title': self.title,
-            'message': self.message,
+            'message': self.message or (self.broadcast.message if self.broadcast else ''),
             'type': self.type,
             'is_read': self.is_read,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'broadcast_id': self.broadcast_id
         }
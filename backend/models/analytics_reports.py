@@ -0,0 +1,18 @@
+from db import db
+from datetime import datetime
+
+class AnalyticsReport(db.Model):
+    __tablename__ = 'analytics_reports'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    report_type = db.Column(db.String(50), nullable=False, index=True)
+    payload = db.Column(db.JSON, nullable=False)
+    generated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'report_type': self.report_type,
+            'generated_at': self.generated_at.isoformat() if self.generated_at else None,
+            **self.payload
+        }
@@ -0,0 +1,24 @@
+from db import db
+from datetime import datetime
+
+class Broadcast(db.Model):
+    __tablename__ = 'broadcasts'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(200), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    plan_id = db.Column(db.Integer, db.ForeignKey('plans.id'))
+    shared_body = db.Column(db.Boolean, default=True)
+    created_by = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'message': self.message,
+            'plan_id': self.plan_id,
+            'shared_body': self.shared_body,
+            'created_by': self.created_by,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
@@ -1,13 +1,47 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, current_app, g
 from werkzeug.security import check_password_hash
 from models.users import User
+from models.plans import Plan
 from models.audit_logs import AuditLog
+from models.analytics_reports import AnalyticsReport
+from models.broadcasts import Broadcast
+from services.admin_service import migrate_plan_subscribers, MIGRATION_CHUNK_SIZE
+from services.broadcast_service import broadcast_alert, BROADCAST_CHUNK_SIZE
+from services.analytics_service import build_cohort_report, REPORT_TYPE
+from services.import_service import import_users, missing_columns, IMPORT_BATCH_SIZE
+from services.lifecycle_service import run_subscription_lifecycle, LIFECYCLE_CHUNK_SIZE
+from utils.rate_limit import login_limiter
+from utils.jobs import start_job, get_job
+from utils.profiler import profiler, folded
+from utils.sharding import scatter_gather, sync_global_tables
 from db import db
 from datetime import datetime
+from functools import wraps
+import os
+import tempfile
 
 admin_bp = Blueprint('admin', __name__)
 
+def admin_required(view):
+    """Run the view only when the User-ID header names an admin, exposed to it as g.admin_id"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        user_id = request.headers.get('User-ID')
+        if not user_id:
+            return jsonify({'error': 'User not authenticated'}), 401
+        try:
+            admin_user = db.session.get(User, int(user_id))
+        except ValueError:
+            return jsonify({'error': 'Invalid User ID'}), 400
+        if not admin_user or admin_user.role != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        g.admin_id = admin_user.id
+        return view(*args, **kwargs)
+    return wrapper
+
 @admin_bp.route('/login', methods=['POST'])
+@login_limiter.limit
 def admin_login():
     try:
         data = request.get_json()
@@ -33,12 +67,13 @@ def admin_login():
             user_agent=request.headers.get('User-Agent')
         )
         db.session.add(audit_log)
+        user_data = admin_user.to_dict()
         db.session.commit()
         
         return jsonify({
             'success': True,
             'message': 'Login successful',
-            'user': admin_user.to_dict(),
+            'user': user_data,
             'redirect_url': '/admin/dashboard'
         }), 200
         
@@ -54,14 +89,344 @@ def admin_dashboard():
 def manage_plans():
     return jsonify({'message': 'Manage plans - to be implemented'}), 200
 
+@admin_bp.route('/plans/<int:plan_id>/migrate', methods=['POST'])
+@admin_required
+def migrate_plan(plan_id):
+    try:
+        data = request.get_json() or {}
+        if not data.get('target_plan_id'):
+            return jsonify({'error': 'Target plan ID is required'}), 400
+        try:
+            target_plan_id = int(data['target_plan_id'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Target plan ID must be an integer'}), 400
+        chunk_size = int(data.get('chunk_size', MIGRATION_CHUNK_SIZE))
+        
+        if target_plan_id == plan_id:
+            return jsonify({'error': 'Target plan must differ from the source plan'}), 400
+        if chunk_size <= 0:
+            return jsonify({'error': 'Chunk size must be positive'}), 400
+        
+        if not db.session.get(Plan, plan_id):
+            return jsonify({'error': 'Plan not found'}), 404
+        target_plan = db.session.get(Plan, target_plan_id)
+        if not target_plan or not target_plan.is_active:
+            return jsonify({'error': 'Target plan not found or inactive'}), 404
+        
+        params = {
+            'from_plan_id': plan_id,
+            'to_plan_id': target_plan_id,
+            'admin_id': g.admin_id,
+            'chunk_size': chunk_size,
+            'deactivate_source': bool(data.get('deactivate_source', False))
+        }
+        job = start_job(
+            current_app._get_current_object(),
+            'plan_migration',
+            lambda job: migrate_plan_subscribers(job, **params),
+            params
+        )
+        
+        return jsonify({
+            'success': True,
+            'message': 'Plan migration started',
+            'job': job.to_dict()
+        }), 202
+        
+    except ValueError:
+        return jsonify({'error': 'Chunk size must be an integer'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/subscriptions/lifecycle', methods=['POST'])
+@admin_required
+def run_lifecycle():
+    try:
+        data = request.get_json(silent=True) or {}
+        chunk_size = int(data.get('chunk_size', LIFECYCLE_CHUNK_SIZE))
+        if chunk_size <= 0:
+            return jsonify({'error': 'Chunk size must be positive'}), 400
+        
+        params = {
+            'auto_renew': bool(data.get('auto_renew', current_app.config['SUBSCRIPTION_AUTO_RENEW'])),
+            'chunk_size': chunk_size
+        }
+        job = start_job(
+            current_app._get_current_object(),
+            'subscription_lifecycle',
+            lambda job: run_subscription_lifecycle(job, **params),
+            params
+        )
+        
+        return jsonify({
+            'success': True,
+            'message': 'Subscription lifecycle run started',
+            'job': job.to_dict()
+        }), 202
+        
+    except ValueError:
+        return jsonify({'error': 'Chunk size must be an integer'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/alerts/broadcast', methods=['POST'])
+@admin_required
+def broadcast():
+    try:
+        data = request.get_json() or {}
+        title = data.get('title')
+        message = data.get('message')
+        plan_id = data.get('plan_id')
+        chunk_size = int(data.get('chunk_size', BROADCAST_CHUNK_SIZE))
+        
+        if not title or not message:
+            return jsonify({'error': 'Title and message are required'}), 400
+        if chunk_size <= 0:
+            return jsonify({'error': 'Chunk size must be positive'}), 400
+        if plan_id and not db.session.get(Plan, plan_id):
+            return jsonify({'error': 'Plan not found'}), 404
+        
+        new_broadcast = Broadcast(
+            title=title,
+            message=message,
+            plan_id=plan_id,
+            shared_body=bool(data.get('shared_body', True)),
+            created_by=g.admin_id
+        )
+        db.session.add(new_broadcast)
+        db.session.commit()
+        # Shard-local alerts join their broadcast on the same shard
+        sync_global_tables()
+        
+        params = {'broadcast_id': new_broadcast.id, 'chunk_size': chunk_size}
+        job = start_job(
+            current_app._get_current_object(),
+            'alert_broadcast',
+            lambda job: broadcast_alert(job, **params),
+            params
+        )
+        
+        return jsonify({
+            'success': True,
+            'message': 'Broadcast started',
+            'broadcast': new_broadcast.to_dict(),
+            'job': job.to_dict()
+        }), 202
+        
+    except ValueError:
+        return jsonify({'error': 'Chunk size must be an integer'}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/jobs/<job_id>', methods=['GET'])
+@admin_required
+def job_status(job_id):
+    job = get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify({'success': True, 'job': job.to_dict()}), 200
+
+@admin_bp.route('/jobs/<job_id>/cancel', methods=['POST'])
+@admin_required
+def cancel_job(job_id):
+    job = get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    job.cancel()
+    return jsonify({'success': True, 'job': job.to_dict()}), 200
+
+@admin_bp.route('/metrics', methods=['GET'])
+@admin_required
+def metrics():
+    return jsonify({
+        'success': True,
+        'rate_limits': {'login': login_limiter.metrics()}
+    }), 200
+
+@admin_bp.route('/profiles', methods=['GET', 'POST'])
+@admin_required
+def profiles():
+    try:
+        if request.method == 'GET':
+            summary = profiler.summary()
+            return jsonify({
+                'success': True,
+                'captures': summary['captures'],
+                'always_on': profiler.always_on,
+                'endpoints': summary['endpoints']
+            }), 200
+        
+        data = request.get_json() or {}
+        endpoint = data.get('endpoint')
+        count = int(data.get('requests', 10))
+        
+        if endpoint not in current_app.view_functions:
+            return jsonify({'error': 'Unknown endpoint, use a name such as user.user_dashboard'}), 400
+        if count <= 0:
+            return jsonify({'error': 'Request count must be positive'}), 400
+        
+        capture = profiler.capture(endpoint, count)
+        return jsonify({
+            'success': True,
+            'message': f'Profiling the next {count} requests to {endpoint}',
+            'capture': profiler.describe(capture)
+        }), 201
+        
+    except ValueError:
+        return jsonify({'error': 'Request count must be an integer'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _folded_download(stacks, filename):
+    return Response(folded(stacks), mimetype='text/plain', headers={
+        'Content-Disposition': f'attachment; filename={filename}'
+    })
+
+@admin_bp.route('/profiles/<int:capture_id>/flamegraph', methods=['GET'])
+@admin_required
+def capture_flamegraph(capture_id):
+    capture = profiler.captures.get(capture_id)
+    if not capture:
+        return jsonify({'error': 'Profile not found'}), 404
+    
+    return _folded_download(profiler.snapshot(capture.stacks), f'profile-{capture.id}-{capture.endpoint}.folded')
+
+@admin_bp.route('/profiles/endpoints/<endpoint>/flamegraph', methods=['GET'])
+@admin_required
+def endpoint_flamegraph(endpoint):
+    stacks = profiler.snapshot(profiler.endpoint_stacks.get(endpoint))
+    if not stacks:
+        return jsonify({'error': 'No samples for this endpoint'}), 404
+    
+    return _folded_download(stacks, f'profile-{endpoint}.folded')
+
 @admin_bp.route('/discounts', methods=['GET', 'POST'])
 def manage_discounts():
     return jsonify({'message': 'Manage discounts - to be implemented'}), 200
 
 @admin_bp.route('/users', methods=['GET'])
 def manage_users():
-    return jsonify({'message': 'Manage users - to be implemented'}), 200
+    try:
+        limit = min(int(request.args.get('limit', 100)), 1000)
+        after_id = int(request.args.get('after_id', 0))
+        
+        # Each shard returns its first page; the merged page is the lowest ids overall
+        pages = scatter_gather(lambda: [
+            user.to_dict() for user in User.query.filter(User.id > after_id).order_by(User.id).limit(limit)
+        ])
+        users = sorted((user for page in pages for user in page), key=lambda user: user['id'])[:limit]
+        
+        return jsonify({
+            'success': True,
+            'users': users,
+            'next_after_id': users[-1]['id'] if len(users) == limit else None
+        }), 200
+        
+    except ValueError:
+        return jsonify({'error': 'Limit and after_id must be integers'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/users/import', methods=['POST'])
+@admin_required
+def import_users_csv():
+    path = None
+    try:
+        upload = request.files.get('file')
+        if not upload:
+            return jsonify({'error': 'A CSV file is required'}), 400
+        
+        plan_id = request.form.get('plan_id') or None
+        if plan_id is not None:
+            if not plan_id.isdigit():
+                return jsonify({'error': 'Plan ID must be an integer'}), 400
+            plan_id = int(plan_id)
+        batch_size = int(request.form.get('batch_size', IMPORT_BATCH_SIZE))
+        if batch_size <= 0:
+            return jsonify({'error': 'Batch size must be positive'}), 400
+        if plan_id:
+            plan = db.session.get(Plan, plan_id)
+            if not plan or not plan.is_active:
+                return jsonify({'error': 'Plan not found or inactive'}), 404
+        
+        # Spool the upload to disk so the job can stream it after this request ends
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        upload.save(path)
+        missing = missing_columns(path)
+        if missing:
+            return jsonify({'error': f"CSV is missing columns: {', '.join(missing)}"}), 400
+        
+        params = {
+            'filename': upload.filename,
+            'plan_id': plan_id,
+            'admin_id': g.admin_id,
+            'batch_size': batch_size
+        }
+        
+        def run(job, path=path):
+            try:
+                return import_users(
+                    job, path, plan_id=params['plan_id'], admin_id=params['admin_id'],
+                    batch_size=batch_size, workers=current_app.config['IMPORT_WORKERS']
+                )
+            finally:
+                os.remove(path)
+        
+        job = start_job(current_app._get_current_object(), 'user_import', run, params)
+        path = None
+        
+        return jsonify({
+            'success': True,
+            'message': 'User import started',
+            'job': job.to_dict()
+        }), 202
+        
+    except ValueError:
+        return jsonify({'error': 'Batch size must be an integer'}), 400
+    except UnicodeDecodeError:
+        return jsonify({'error': 'CSV must be UTF-8 encoded'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        # Removed here unless a started job now owns the file
+        if path:
+            os.remove(path)
 
 @admin_bp.route('/analytics', methods=['GET'])
+@admin_required
 def analytics():
-    return jsonify({'message': 'Analytics - to be implemented'}), 200
+    try:
+        # Served straight from the last batch run; nothing is aggregated per request
+        report = AnalyticsReport.query.filter_by(
+            report_type=REPORT_TYPE
+        ).order_by(AnalyticsReport.id.desc()).first()
+        
+        if not report:
+            return jsonify({'error': 'No analytics report has been generated yet'}), 404
+        
+        return jsonify({'success': True, 'report': report.to_dict()}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/analytics/refresh', methods=['POST'])
+@admin_required
+def refresh_analytics():
+    try:
+        workers = current_app.config['ANALYTICS_WORKERS']
+        job = start_job(
+            current_app._get_current_object(),
+            'cohort_report',
+            lambda job: build_cohort_report(job, workers=workers)
+        )
+        
+        return jsonify({
+            'success': True,
+            'message': 'Analytics report started',
+            'job': job.to_dict()
+        }), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
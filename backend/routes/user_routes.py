@@ -1,11 +1,19 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, current_app
 from werkzeug.security import generate_password_hash, check_password_hash
 from models.users import User
 from models.plans import Plan
 from models.subscriptions import Subscription
 from models.audit_logs import AuditLog
-from db import db
+from services.user_service import get_dashboard_snapshot
+from utils.rate_limit import login_limiter
+from utils.cache import invalidate_user_dashboard
+from utils.pubsub import alert_hub
+from db import db, remember_user_write
 from datetime import datetime
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+import json
+import queue
 
 user_bp = Blueprint('user', __name__)
 
@@ -34,7 +42,7 @@ def user_signup():
         )
         
         db.session.add(new_user)
-        db.session.commit()
+        db.session.flush()
         
         # Log the signup action
         audit_log = AuditLog(
@@ -47,20 +55,27 @@ def user_signup():
             user_agent=request.headers.get('User-Agent')
         )
         db.session.add(audit_log)
+        user_data = new_user.to_dict()
         db.session.commit()
+        remember_user_write(user_data['id'])
         
         return jsonify({
             'success': True,
             'message': 'User created successfully',
-            'user': new_user.to_dict(),
+            'user': user_data,
             'redirect_url': '/user/dashboard'
         }), 201
         
+    except IntegrityError:
+        # A concurrent signup claimed the email between the check and the insert
+        db.session.rollback()
+        return jsonify({'error': 'User with this email already exists'}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @user_bp.route('/login', methods=['POST'])
+@login_limiter.limit
 def user_login():
     try:
         data = request.get_json()
@@ -86,12 +101,13 @@ def user_login():
             user_agent=request.headers.get('User-Agent')
         )
         db.session.add(audit_log)
+        user_data = user.to_dict()
         db.session.commit()
         
         return jsonify({
             'success': True,
             'message': 'Login successful',
-            'user': user.to_dict(),
+            'user': user_data,
             'redirect_url': '/user/dashboard'
         }), 200
         
@@ -132,21 +148,24 @@ def get_my_plan():
         if not user_id:
             return jsonify({'error': 'User not authenticated'}), 401
         
-        # Get user's active subscription
-        subscription = Subscription.query.filter_by(
-            user_id=user_id, 
-            status='active'
+        # Get user's active subscription together with its plan, ignoring lapsed
+        # cycles the nightly lifecycle job has not expired yet
+        row = db.session.query(Subscription, Plan).outerjoin(
+            Plan, Plan.id == Subscription.plan_id
+        ).filter(
+            Subscription.user_id == user_id,
+            Subscription.status == 'active',
+            or_(Subscription.end_date.is_(None), Subscription.end_date >= datetime.now().date())
         ).first()
         
-        if not subscription:
+        if not row:
             return jsonify({
                 'success': True,
                 'has_plan': False,
                 'message': 'No active plan found'
             }), 200
         
-        # Get plan details
-        plan = Plan.query.get(subscription.plan_id)
+        subscription, plan = row
         
         return jsonify({
             'success': True,
@@ -167,9 +186,11 @@ def purchase_plan():
         if not user_id or not plan_id:
             return jsonify({'error': 'User ID and Plan ID are required'}), 400
         
-        # Validate user exists
-        user = User.query.get(user_id)
-        if not user:
+        # Validate user exists and fetch any active subscription in the same query
+        row = db.session.query(User.id, Subscription).outerjoin(
+            Subscription, and_(Subscription.user_id == User.id, Subscription.status == 'active')
+        ).filter(User.id == user_id).first()
+        if not row:
             return jsonify({'error': 'User not found'}), 404
             
         # Validate plan exists
@@ -177,12 +198,7 @@ def purchase_plan():
         if not plan:
             return jsonify({'error': 'Plan not found'}), 404
             
-        # Check if user already has an active subscription
-        existing_subscription = Subscription.query.filter_by(
-            user_id=user_id, 
-            status='active'
-        ).first()
-        
+        existing_subscription = row[1]
         if existing_subscription:
             # Cancel existing subscription
             existing_subscription.status = 'cancelled'
@@ -199,6 +215,7 @@ def purchase_plan():
         )
         
         db.session.add(new_subscription)
+        db.session.flush()
         
         # Log the purchase
         audit_log = AuditLog(
@@ -211,13 +228,16 @@ def purchase_plan():
             user_agent=request.headers.get('User-Agent')
         )
         db.session.add(audit_log)
+        subscription_data = new_subscription.to_dict()
+        plan_data = plan.to_dict()
         db.session.commit()
+        invalidate_user_dashboard(user_id)
         
         return jsonify({
             'success': True,
             'message': 'Plan purchased successfully',
-            'subscription': new_subscription.to_dict(),
-            'plan': plan.to_dict()
+            'subscription': subscription_data,
+            'plan': plan_data
         }), 201
         
     except Exception as e:
@@ -233,16 +253,14 @@ def cancel_plan():
         if not user_id:
             return jsonify({'error': 'User ID is required'}), 400
             
-        user = User.query.get(user_id)
-        if not user:
+        # User, active subscription and its plan name in one query
+        row = db.session.query(User.id, Subscription, Plan.name).outerjoin(
+            Subscription, and_(Subscription.user_id == User.id, Subscription.status == 'active')
+        ).outerjoin(Plan, Plan.id == Subscription.plan_id).filter(User.id == user_id).first()
+        if not row:
             return jsonify({'error': 'User not found'}), 404
-            
-        # Find active subscription
-        active_subscription = Subscription.query.filter_by(
-            user_id=user_id,
-            status='active'
-        ).first()
         
+        _, active_subscription, plan_name = row
         if not active_subscription:
             return jsonify({'error': 'No active subscription found'}), 404
             
@@ -256,7 +274,7 @@ def cancel_plan():
             user_id=user_id,
             title='Plan Cancelled',
             type='system',
-            message=f'Your {active_subscription.plan.name} plan has been cancelled. You will continue to have access until {active_subscription.end_date}.',
+            message=f'Your {plan_name} plan has been cancelled. You will continue to have access until {active_subscription.end_date}.',
             is_read=False
         )
         db.session.add(alert)
@@ -273,12 +291,18 @@ def cancel_plan():
             user_agent=request.headers.get('User-Agent')
         )
         db.session.add(audit_log)
+        # Serialise before commit so the response does not reload expired rows
+        db.session.flush()
+        alert_event = alert.to_dict()
+        subscription_data = active_subscription.to_dict()
         db.session.commit()
+        invalidate_user_dashboard(user_id)
+        alert_hub.publish(user_id, alert_event)
         
         return jsonify({
             'success': True,
             'message': 'Plan cancelled successfully',
-            'subscription': active_subscription.to_dict()
+            'subscription': subscription_data
         }), 200
         
     except Exception as e:
@@ -307,6 +331,69 @@ def get_user_alerts():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _sse_event(alert):
+    return f"id: {alert['id']}\nevent: alert\ndata: {json.dumps(alert)}\n\n"
+
+def _alert_stream(user_id, listener, backlog, heartbeat_seconds):
+    try:
+        yield 'retry: 3000\n\n'
+        for alert in backlog:
+            yield _sse_event(alert)
+        # Only the catch-up may repeat a published alert; jobs can publish out of id order
+        sent_ids = {alert['id'] for alert in backlog}
+        
+        # Waiting on the hub queue costs no queries while the user is idle
+        while not listener.overflowed:
+            try:
+                alert = listener.get(timeout=heartbeat_seconds)
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+                continue
+            if alert['id'] in sent_ids:
+                sent_ids.discard(alert['id'])
+                continue
+            yield _sse_event(alert)
+    finally:
+        alert_hub.unsubscribe(user_id, listener)
+
+@user_bp.route('/alerts/stream', methods=['GET'])
+def stream_user_alerts():
+    try:
+        # EventSource cannot send custom headers, so the query string is accepted too
+        user_id = request.headers.get('User-ID') or request.args.get('user_id')
+        if not user_id:
+            return jsonify({'error': 'User ID is required'}), 400
+        user_id = int(user_id)
+        
+        user = User.query.get(user_id)
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        # Subscribe before the catch-up query so nothing falls between the two
+        listener = alert_hub.subscribe(user_id)
+        
+        backlog = []
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        if last_event_id and last_event_id.isdigit():
+            from models.alerts import Alert
+            backlog = [alert.to_dict() for alert in Alert.query.filter(
+                Alert.user_id == user_id,
+                Alert.id > int(last_event_id)
+            ).order_by(Alert.id).all()]
+        
+        stream = _alert_stream(
+            user_id, listener, backlog, current_app.config['ALERT_STREAM_HEARTBEAT']
+        )
+        return Response(stream, mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        
+    except ValueError:
+        return jsonify({'error': 'Invalid User ID'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @user_bp.route('/alerts/<int:alert_id>/read', methods=['PUT'])
 def mark_alert_read(alert_id):
     try:
@@ -322,6 +409,7 @@ def mark_alert_read(alert_id):
             
         alert.is_read = True
         db.session.commit()
+        invalidate_user_dashboard(user_id)
         
         return jsonify({
             'success': True,
@@ -331,10 +419,24 @@ def mark_alert_read(alert_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-# Placeholder routes for future development
 @user_bp.route('/dashboard', methods=['GET'])
 def user_dashboard():
-    return jsonify({'message': 'User dashboard - to be implemented'}), 200
+    try:
+        user_id = request.headers.get('User-ID')
+        if not user_id:
+            return jsonify({'error': 'User not authenticated'}), 401
+        
+        snapshot = get_dashboard_snapshot(user_id)
+        if snapshot is None:
+            return jsonify({'error': 'User not found'}), 404
+        
+        return jsonify({'success': True, **snapshot}), 200
+    except ValueError:
+        return jsonify({'error': 'Invalid User ID'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Placeholder routes for future development
 
 @user_bp.route('/subscriptions', methods=['GET', 'POST'])
 def my_subscriptions():
@@ -1,2 +1,111 @@
-# Admin service - to be implemented
-# This will contain business logic for admin operations
+# Admin service
+# Business logic for admin operations
+from datetime import datetime
+from sqlalchemy import func, insert, literal, null, or_, update
+from models.plans import Plan
+from models.subscriptions import Subscription
+from models.audit_logs import AuditLog
+from utils.cache import dashboard_cache
+from utils.helpers import next_chunk_upper_bound
+from utils.sharding import each_shard, scatter_gather, sync_global_tables
+from db import db, use_shard
+
+MIGRATION_CHUNK_SIZE = 5000
+
+
+def migrate_plan_subscribers(job, from_plan_id, to_plan_id, admin_id=None,
+                             chunk_size=MIGRATION_CHUNK_SIZE, deactivate_source=False):
+    """Move every active subscriber of one plan onto another in id-ranged chunks
+
+    Each chunk copies the active rows into new subscriptions with
+    INSERT ... SELECT, cancels the originals with one UPDATE and records a
+    single summarised audit entry, then commits. A cancelled or failed job can
+    simply be started again: already migrated rows are no longer active on the
+    source plan and are skipped.
+    """
+    from_plan_id, to_plan_id = int(from_plan_id), int(to_plan_id)
+    # Migrating onto the source plan would keep producing new source rows forever
+    if from_plan_id == to_plan_id:
+        raise ValueError('Target plan must differ from the source plan')
+
+    target_plan = db.session.get(Plan, to_plan_id)
+    price_paid = target_plan.monthly_price
+    subscriptions = Subscription.__table__
+    # Lapsed cycles the lifecycle job has not expired yet stay behind, as in get_my_plan
+    today = datetime.now().date()
+    active_on_source = [
+        subscriptions.c.plan_id == from_plan_id,
+        subscriptions.c.status == 'active',
+        or_(subscriptions.c.end_date.is_(None), subscriptions.c.end_date >= today)
+    ]
+
+    job.total = sum(scatter_gather(
+        lambda: db.session.query(func.count(Subscription.id)).filter(*active_on_source).scalar()
+    ))
+
+    chunks = 0
+    for shard_key in each_shard():
+        with use_shard(shard_key):
+            chunks += _migrate_shard(
+                job, subscriptions, active_on_source, from_plan_id, to_plan_id,
+                price_paid, admin_id, chunk_size
+            )
+
+    if deactivate_source and not job.is_cancelled:
+        db.session.query(Plan).filter_by(id=from_plan_id).update({'is_active': False})
+        db.session.commit()
+        sync_global_tables()
+
+    # Snapshots of every migrated user are stale now
+    dashboard_cache.clear()
+    return {'migrated': job.processed, 'chunks': chunks}
+
+
+def _migrate_shard(job, subscriptions, active_on_source, from_plan_id, to_plan_id,
+                   price_paid, admin_id, chunk_size):
+    last_id = 0
+    chunks = 0
+    while not job.is_cancelled:
+        upper_id = next_chunk_upper_bound(subscriptions.c.id, active_on_source, last_id, chunk_size)
+        if upper_id is None:
+            break
+
+        now = datetime.utcnow()
+        today = now.date()
+        in_chunk = active_on_source + [subscriptions.c.id > last_id, subscriptions.c.id <= upper_id]
+
+        # Insert first: the SELECT must still see the source rows as active
+        source_rows = db.session.query(
+            subscriptions.c.user_id,
+            literal(to_plan_id),
+            literal('active'),
+            literal(today),
+            null(),
+            literal(price_paid),
+            literal(now),
+            literal(now)
+        ).filter(*in_chunk)
+        db.session.execute(insert(subscriptions).from_select(
+            ['user_id', 'plan_id', 'status', 'start_date', 'end_date',
+             'price_paid', 'created_at', 'updated_at'],
+            source_rows
+        ))
+        migrated = db.session.execute(
+            update(subscriptions).where(*in_chunk).values(
+                status='cancelled', end_date=today, updated_at=now
+            )
+        ).rowcount
+
+        db.session.add(AuditLog(
+            user_id=admin_id,
+            action='plan_migrated',
+            table_name='subscriptions',
+            old_values={'plan_id': from_plan_id, 'subscription_ids': [last_id + 1, upper_id]},
+            new_values={'plan_id': to_plan_id, 'price_paid': float(price_paid), 'migrated': migrated}
+        ))
+        db.session.commit()
+
+        last_id = upper_id
+        chunks += 1
+        job.advance(migrated)
+    return chunks
@@ -0,0 +1,264 @@
+# Analytics service
+# Offline cohort retention and churn reports built from streamed chunks
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import multiprocessing
+import os
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import select
+
+from db import db, replica_bind_keys
+from models.users import User
+from models.plans import Plan
+from models.subscriptions import Subscription
+from models.analytics_reports import AnalyticsReport
+from utils.sharding import shard_keys
+
+REPORT_TYPE = 'cohort_retention'
+STREAM_CHUNK_SIZE = 50000
+RETENTION_MONTHS = 12
+# Below this many users the process pool costs more than it saves
+PARALLEL_MIN_USERS = 200000
+# Month index standing in for "still running" on subscriptions without an end_date
+OPEN_END_MONTH = np.iinfo(np.int32).max
+
+
+def _month_index(dates):
+    months = np.array(dates, dtype='datetime64[M]')
+    index = months.astype(np.int64)
+    index[np.isnat(months)] = OPEN_END_MONTH
+    return index
+
+
+def _month_label(index):
+    return str(np.datetime64(int(index), 'M'))
+
+
+def _reader_engines():
+    """Engines to scan: every shard, else a replica when configured, else the primary"""
+    keys = shard_keys() or replica_bind_keys(current_app)[:1]
+    if not keys:
+        return [db.engine]
+    return [db.engines[key] for key in keys]
+
+
+def _ids(values):
+    return np.array(values, dtype=np.int64)
+
+
+def _ended(statuses):
+    return np.array(statuses, dtype=object) != 'active'
+
+
+def _stream_columns(engine, table, columns, criteria=(), chunk_size=STREAM_CHUNK_SIZE):
+    """Read columns of table in id-ordered keyset chunks so no statement holds the table long
+
+    columns maps each column name to a function turning one chunk of its values
+    into a typed array, so at most one chunk is held as Python objects.
+    """
+    names = list(columns)
+    chunks = {name: [] for name in names}
+    last_id = 0
+    with engine.connect() as connection:
+        while True:
+            rows = connection.execute(
+                select(table.c.id, *(table.c[name] for name in names))
+                .where(table.c.id > last_id, *criteria)
+                .order_by(table.c.id)
+                .limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            for position, name in enumerate(names, start=1):
+                chunks[name].append(columns[name]([row[position] for row in rows]))
+    return {
+        name: np.concatenate(arrays) if arrays else columns[name]([])
+        for name, arrays in chunks.items()
+    }
+
+
+def load_arrays(chunk_size=STREAM_CHUNK_SIZE):
+    """Stream customers and their subscriptions from every source into NumPy arrays"""
+    users_table = User.__table__
+    subscriptions_table = Subscription.__table__
+    parts = {key: [] for key in (
+        'user_id', 'signup_month', 'sub_id', 'sub_user_id', 'sub_plan_id',
+        'sub_ended', 'sub_start_month', 'sub_end_month'
+    )}
+
+    for engine in _reader_engines():
+        users = _stream_columns(
+            engine, users_table, {'id': _ids, 'created_at': _month_index},
+            [users_table.c.role == 'user', users_table.c.created_at.isnot(None)], chunk_size
+        )
+        parts['user_id'].append(users['id'])
+        parts['signup_month'].append(users['created_at'])
+
+        subs = _stream_columns(
+            engine, subscriptions_table, {
+                'id': _ids, 'user_id': _ids, 'plan_id': _ids, 'status': _ended,
+                'start_date': _month_index, 'end_date': _month_index
+            },
+            chunk_size=chunk_size
+        )
+        parts['sub_id'].append(subs['id'])
+        parts['sub_user_id'].append(subs['user_id'])
+        parts['sub_plan_id'].append(subs['plan_id'])
+        parts['sub_ended'].append(subs['status'])
+        parts['sub_start_month'].append(subs['start_date'])
+        parts['sub_end_month'].append(subs['end_date'])
+
+    return {key: np.concatenate(arrays) for key, arrays in parts.items()}
+
+
+def _cohort_counts(task):
+    """Count cohort sizes, retained users and churned users for one partition of users
+
+    Runs in a worker process. Subscriptions arrive sorted by user, then start
+    month, so each user's first and last subscription are the edges of their run.
+    """
+    (signup, sub_user, sub_plan, sub_ended, sub_start, sub_end,
+     base_month, n_months, n_plans, report_month, horizon) = task
+
+    cohort = signup - base_month
+    size = np.zeros((n_months, n_plans), dtype=np.int64)
+    retained = np.zeros((n_months, n_plans, horizon), dtype=np.int64)
+    churned = np.zeros((n_plans, n_months), dtype=np.int64)
+
+    # Users without any subscription fall into plan column 0
+    first_plan = np.zeros(len(signup), dtype=np.int64)
+    has_subs = np.zeros(len(signup), dtype=bool)
+    if len(sub_user):
+        users_with_subs, first = np.unique(sub_user, return_index=True)
+        last = np.append(first[1:], len(sub_user)) - 1
+        first_plan[users_with_subs] = sub_plan[first]
+        has_subs[users_with_subs] = True
+
+        # A user whose latest subscription ended without a successor has churned
+        churn_month = sub_end[last] - base_month
+        is_churn = sub_ended[last] & (sub_end[last] != OPEN_END_MONTH) & (churn_month >= 0) & (churn_month < n_months)
+        np.add.at(churned, (sub_plan[last][is_churn], churn_month[is_churn]), 1)
+
+    np.add.at(size, (cohort, first_plan), 1)
+
+    for offset in range(horizon):
+        month = signup + offset
+        sub_month = month[sub_user]
+        active = (sub_start <= sub_month) & (sub_month <= sub_end)
+        user_active = np.zeros(len(signup), dtype=bool)
+        user_active[sub_user[active]] = True
+        # Months after the report date are not observable yet
+        counted = user_active & has_subs & (month <= report_month)
+        np.add.at(retained[:, :, offset], (cohort[counted], first_plan[counted]), 1)
+
+    return size, retained, churned
+
+
+def _partition_tasks(arrays, plan_ids, report_month, horizon, partitions):
+    order = np.argsort(arrays['user_id'], kind='stable')
+    user_id = arrays['user_id'][order]
+    signup = arrays['signup_month'][order]
+
+    # Map subscriptions onto user positions, dropping rows for admins or missing users
+    if len(user_id):
+        sub_user = np.minimum(np.searchsorted(user_id, arrays['sub_user_id']), len(user_id) - 1)
+        known = user_id[sub_user] == arrays['sub_user_id']
+    else:
+        sub_user = np.zeros(len(arrays['sub_user_id']), dtype=np.int64)
+        known = np.zeros(len(sub_user), dtype=bool)
+    sub_order = np.lexsort((arrays['sub_id'][known], arrays['sub_start_month'][known], sub_user[known]))
+    sub_user = sub_user[known][sub_order]
+    sub_plan = np.searchsorted(plan_ids, arrays['sub_plan_id'][known][sub_order]) + 1
+    sub_ended = arrays['sub_ended'][known][sub_order]
+    sub_start = arrays['sub_start_month'][known][sub_order]
+    sub_end = arrays['sub_end_month'][known][sub_order]
+
+    base_month = int(signup.min()) if len(signup) else report_month
+    n_months = report_month - base_month + 1
+    n_plans = len(plan_ids) + 1
+
+    bounds = np.linspace(0, len(user_id), partitions + 1).astype(np.int64)
+    tasks = []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        lo, hi = np.searchsorted(sub_user, [start, stop])
+        tasks.append((
+            signup[start:stop], sub_user[lo:hi] - start, sub_plan[lo:hi], sub_ended[lo:hi],
+            sub_start[lo:hi], sub_end[lo:hi], base_month, n_months, n_plans, report_month, horizon
+        ))
+    return tasks, base_month, n_months
+
+
+def compute_report(arrays, plans, report_month, horizon=RETENTION_MONTHS, workers=None):
+    """Build the cohort retention and churn payload from loaded arrays"""
+    plan_ids = np.array(sorted(plans), dtype=np.int64)
+    workers = workers or os.cpu_count() or 1
+    partitions = workers if len(arrays['user_id']) >= PARALLEL_MIN_USERS else 1
+    tasks, base_month, n_months = _partition_tasks(arrays, plan_ids, report_month, horizon, partitions)
+
+    if partitions > 1:
+        # Spawn rather than fork: the caller may be a threaded web worker
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=partitions, mp_context=context) as pool:
+            results = list(pool.map(_cohort_counts, tasks))
+    else:
+        results = [_cohort_counts(task) for task in tasks]
+
+    size = sum(result[0] for result in results)
+    retained = sum(result[1] for result in results)
+    churned = sum(result[2] for result in results)
+
+    columns = [(None, 'No plan')] + [(int(plan_id), plans[plan_id]) for plan_id in plan_ids]
+    cohorts = []
+    for row, column in zip(*np.nonzero(size)):
+        observable = report_month - (base_month + row) + 1
+        cohorts.append({
+            'signup_month': _month_label(base_month + row),
+            'plan_id': columns[column][0],
+            'plan_name': columns[column][1],
+            'size': int(size[row, column]),
+            'retention': [
+                round(int(retained[row, column, offset]) / int(size[row, column]), 4)
+                if offset < observable else None
+                for offset in range(horizon)
+            ]
+        })
+
+    churn = [{
+        'month': _month_label(base_month + month),
+        'plan_id': columns[column][0],
+        'plan_name': columns[column][1],
+        'churned': int(churned[column, month])
+    } for column, month in zip(*np.nonzero(churned))]
+
+    return {
+        'report_month': _month_label(report_month),
+        'horizon_months': horizon,
+        'cohorts': cohorts,
+        'churn': sorted(churn, key=lambda entry: (entry['month'], entry['plan_name'])),
+        'totals': {
+            'users': int(len(arrays['user_id'])),
+            'subscriptions': int(len(arrays['sub_id'])),
+            'churned_users': int(churned.sum())
+        }
+    }
+
+
+def build_cohort_report(job=None, chunk_size=STREAM_CHUNK_SIZE, workers=None):
+    """Stream the source tables, compute the report and store it for /admin/analytics"""
+    arrays = load_arrays(chunk_size)
+    plans = {plan.id: plan.name for plan in Plan.query.all()}
+    report_month = int(_month_index([datetime.utcnow().date()])[0])
+    if job is not None:
+        job.total = len(arrays['user_id'])
+
+    payload = compute_report(arrays, plans, report_month, workers=workers)
+
+    report = AnalyticsReport(report_type=REPORT_TYPE, payload=payload)
+    db.session.add(report)
+    db.session.commit()
+    if job is not None:
+        job.advance(job.total)
+    return {'report_id': report.id, 'users': payload['totals']['users']}
@@ -0,0 +1,96 @@
+# Broadcast service
+# Fan-out of system alerts to every customer or every subscriber of a plan
+from datetime import datetime
+from sqlalchemy import exists, func, insert, literal, select
+from models.users import User
+from models.subscriptions import Subscription
+from models.alerts import Alert
+from models.audit_logs import AuditLog
+from models.broadcasts import Broadcast
+from utils.cache import dashboard_cache
+from utils.helpers import next_chunk_upper_bound
+from utils.pubsub import alert_hub
+from utils.sharding import each_shard, scatter_gather
+from db import db, use_shard
+
+BROADCAST_CHUNK_SIZE = 5000
+
+
+def _recipient_criteria(plan_id):
+    users = User.__table__
+    criteria = [users.c.role == 'user']
+    if plan_id:
+        subscriptions = Subscription.__table__
+        criteria.append(exists().where(
+            subscriptions.c.user_id == users.c.id,
+            subscriptions.c.plan_id == plan_id,
+            subscriptions.c.status == 'active'
+        ))
+    return criteria
+
+
+def broadcast_alert(job, broadcast_id, chunk_size=BROADCAST_CHUNK_SIZE):
+    """Create a system alert for every recipient of a broadcast in user-id-ranged chunks
+
+    Each chunk is one INSERT ... SELECT from users, so a user with several
+    active subscriptions on the plan still gets a single alert. With a shared
+    body the alert rows carry only the broadcast_id and read the text from the
+    broadcast. A cancelled job keeps the alerts already committed.
+    """
+    broadcast = db.session.get(Broadcast, broadcast_id)
+    users = User.__table__
+    recipients = _recipient_criteria(broadcast.plan_id)
+
+    job.total = sum(scatter_gather(
+        lambda: db.session.query(func.count(users.c.id)).filter(*recipients).scalar()
+    ))
+
+    for shard_key in each_shard():
+        with use_shard(shard_key):
+            _broadcast_shard(job, broadcast, recipients, chunk_size)
+
+    db.session.add(AuditLog(
+        user_id=broadcast.created_by,
+        action='alert_broadcast',
+        table_name='alerts',
+        new_values={'broadcast_id': broadcast.id, 'plan_id': broadcast.plan_id, 'recipients': job.processed}
+    ))
+    db.session.commit()
+    return {'broadcast_id': broadcast.id, 'recipients': job.processed}
+
+
+def _broadcast_shard(job, broadcast, recipients, chunk_size):
+    users = User.__table__
+    alerts = Alert.__table__
+    title = broadcast.title
+    message = '' if broadcast.shared_body else broadcast.message
+    broadcast_id = broadcast.id
+    last_id = 0
+    while not job.is_cancelled:
+        upper_id = next_chunk_upper_bound(users.c.id, recipients, last_id, chunk_size)
+        if upper_id is None:
+            break
+
+        now = datetime.utcnow()
+        in_chunk = recipients + [users.c.id > last_id, users.c.id <= upper_id]
+        sent = db.session.execute(insert(alerts).from_select(
+            ['user_id', 'title', 'message', 'type', 'is_read', 'created_at', 'broadcast_id'],
+            select(
+                users.c.id, literal(title), literal(message), literal('system'),
+                literal(False), literal(now), literal(broadcast_id)
+            ).where(*in_chunk)
+        )).rowcount
+        db.session.commit()
+        # Cached dashboards carry unread counts
+        dashboard_cache.clear()
+
+        listening = [user_id for user_id in alert_hub.subscribed_user_ids() if last_id < user_id <= upper_id]
+        if listening:
+            for alert in Alert.query.filter(
+                Alert.broadcast_id == broadcast_id,
+                Alert.user_id.in_(listening)
+            ):
+                alert_hub.publish_alert(alert)
+
+        last_id = upper_id
+        job.advance(sent)
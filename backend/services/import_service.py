@@ -0,0 +1,209 @@
+# Import service
+# Bulk creation of enterprise users from uploaded CSV files
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import csv
+import multiprocessing
+import os
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+
+from models.users import User
+from models.plans import Plan
+from models.subscriptions import Subscription
+from models.audit_logs import AuditLog
+from utils.sharding import allocate_user_ids, registered_user_ids, scatter_gather, shard_keys, user_shard_key
+from db import db, use_shard
+
+IMPORT_BATCH_SIZE = 1000
+REQUIRED_COLUMNS = ('name', 'email', 'password')
+# Only the first errors are kept on the job; the rest are counted
+MAX_REPORTED_ERRORS = 500
+# Below this many rows spawning workers costs more than hashing inline
+PARALLEL_MIN_ROWS = 16
+
+
+def _open_csv(path):
+    # utf-8-sig drops the byte order mark spreadsheet exports often start with
+    return open(path, newline='', encoding='utf-8-sig')
+
+
+def missing_columns(path):
+    """Required columns absent from the CSV header"""
+    with _open_csv(path) as handle:
+        header = next(csv.reader(handle), [])
+    present = {column.strip().lower() for column in header}
+    return [column for column in REQUIRED_COLUMNS if column not in present]
+
+
+def _count_rows(path):
+    with _open_csv(path) as handle:
+        return max(sum(1 for _ in csv.reader(handle)) - 1, 0)
+
+
+def _read_batches(path, batch_size):
+    """Yield lists of (line number, row) without loading the whole file"""
+    with _open_csv(path) as handle:
+        reader = csv.DictReader(handle)
+        reader.fieldnames = [column.strip().lower() for column in reader.fieldnames or []]
+        batch = []
+        for row in reader:
+            batch.append((reader.line_num, {
+                column: (row.get(column) or '').strip() for column in REQUIRED_COLUMNS
+            }))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def _existing_emails(emails):
+    """Emails already taken, from the primary's registry when sharded or one IN query otherwise"""
+    if shard_keys():
+        return set(registered_user_ids(emails))
+    found = scatter_gather(lambda: [
+        email for (email,) in db.session.query(User.email).filter(User.email.in_(emails))
+    ])
+    return {email for emails_on_shard in found for email in emails_on_shard}
+
+
+def import_users(job, path, plan_id=None, admin_id=None, batch_size=IMPORT_BATCH_SIZE, workers=None):
+    """Create users from a CSV of name, email and password columns
+
+    Rows are read in batches. Each batch is checked against the file so far
+    and against every shard with a single lookup, has its passwords hashed
+    across a process pool, and is written with one multi-row INSERT per shard
+    (plus one for subscriptions when plan_id is given) before committing.
+    Rejected rows are reported with their line number and never stop the import;
+    a batch that loses an email to a concurrent signup is retried row by row.
+    """
+    plan = db.session.get(Plan, plan_id) if plan_id else None
+    job.total = _count_rows(path)
+    workers = workers or os.cpu_count() or 1
+
+    seen = set()
+    errors = []
+    counts = {'imported': 0, 'failed': 0}
+
+    def reject(line, email, message):
+        counts['failed'] += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({'row': line, 'email': email or None, 'error': message})
+
+    pool = None
+    if workers > 1 and job.total >= PARALLEL_MIN_ROWS:
+        # Spawn rather than fork: the import runs on a thread of the web worker
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        for batch in _read_batches(path, batch_size):
+            if job.is_cancelled:
+                break
+
+            candidates = []
+            for line, row in batch:
+                email = row['email']
+                if not all(row.values()):
+                    reject(line, email, 'Name, email, and password are required')
+                elif '@' not in email:
+                    reject(line, email, 'Invalid email address')
+                elif email in seen:
+                    reject(line, email, 'Duplicate email in file')
+                else:
+                    seen.add(email)
+                    candidates.append((line, row))
+
+            existing = _existing_emails([row['email'] for _, row in candidates]) if candidates else set()
+            accepted = []
+            for line, row in candidates:
+                if row['email'] in existing:
+                    reject(line, row['email'], 'User with this email already exists')
+                else:
+                    accepted.append((line, row))
+
+            if accepted:
+                rows = [row for _, row in accepted]
+                hashes = _hash_passwords(rows, pool, workers)
+                try:
+                    counts['imported'] += _insert_users(rows, hashes, plan)
+                except IntegrityError:
+                    # A signup took one of the emails after the check; retry row by row to find it
+                    db.session.rollback()
+                    for (line, row), password_hash in zip(accepted, hashes):
+                        try:
+                            counts['imported'] += _insert_users([row], [password_hash], plan)
+                        except IntegrityError:
+                            db.session.rollback()
+                            reject(line, row['email'], 'User with this email already exists')
+            job.advance(len(batch))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    db.session.add(AuditLog(
+        user_id=admin_id,
+        action='users_imported',
+        table_name='users',
+        new_values={
+            'imported': counts['imported'],
+            'failed': counts['failed'],
+            'plan_id': plan.id if plan else None
+        }
+    ))
+    db.session.commit()
+
+    return {**counts, 'errors': sorted(errors, key=lambda error: error['row'])}
+
+
+def _hash_passwords(rows, pool, workers):
+    passwords = [row['password'] for row in rows]
+    if pool is not None:
+        chunksize = max(len(passwords) // (workers * 4), 1)
+        return list(pool.map(generate_password_hash, passwords, chunksize=chunksize))
+    return [generate_password_hash(password) for password in passwords]
+
+
+def _insert_users(rows, hashes, plan):
+    now = datetime.utcnow()
+    users = [{
+        'name': row['name'],
+        'email': row['email'],
+        'password_hash': password_hash,
+        'role': 'user',
+        'created_at': now
+    } for row, password_hash in zip(rows, hashes)]
+
+    # Shards cannot share an autoincrement, so sharded imports draw ids up front
+    by_shard = {None: users}
+    if shard_keys():
+        with db.engine.begin() as connection:
+            user_ids = allocate_user_ids(connection, [user['email'] for user in users])
+        by_shard = {}
+        for user, user_id in zip(users, user_ids):
+            user['id'] = user_id
+            by_shard.setdefault(user_shard_key(user_id), []).append(user)
+
+    for shard_key, shard_users in by_shard.items():
+        with use_shard(shard_key):
+            db.session.execute(insert(User.__table__), shard_users)
+            if plan is None:
+                continue
+            if shard_key is None:
+                emails = [user['email'] for user in shard_users]
+                user_ids = [user_id for (user_id,) in db.session.query(User.id).filter(User.email.in_(emails))]
+            else:
+                user_ids = [user['id'] for user in shard_users]
+            db.session.execute(insert(Subscription.__table__), [{
+                'user_id': user_id,
+                'plan_id': plan.id,
+                'status': 'active',
+                'start_date': now.date(),
+                'end_date': None,
+                'price_paid': plan.monthly_price,
+                'created_at': now,
+                'updated_at': now
+            } for user_id in user_ids])
+    db.session.commit()
+    return len(users)
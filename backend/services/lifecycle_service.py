@@ -0,0 +1,156 @@
+# Lifecycle service
+# Nightly expiry and auto-renewal of subscriptions past their end_date
+import calendar
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, insert, literal, select, update
+from models.plans import Plan
+from models.subscriptions import Subscription
+from models.alerts import Alert
+from models.audit_logs import AuditLog
+from utils.cache import dashboard_cache
+from utils.helpers import next_chunk_upper_bound
+from utils.pubsub import alert_hub
+from utils.sharding import each_shard, scatter_gather
+from db import db, use_shard
+
+LIFECYCLE_CHUNK_SIZE = 5000
+
+
+def renewal_cycle(end_date, today):
+    """Start and end of the cycle that renews a subscription lapsed on end_date
+
+    The renewal lands in the cycle containing today, so a subscription that
+    lapsed months ago is billed once rather than for every missed month. Cycles
+    end on end_date's day of the month, clamped in shorter months; an end_date
+    on the last day of its month keeps ending on the last day, so a 31st does
+    not drift to the 28th after February.
+    """
+    anchor_day = end_date.day
+    if anchor_day == calendar.monthrange(end_date.year, end_date.month)[1]:
+        anchor_day = 31
+    start_date = end_date + timedelta(days=1)
+    year, month = end_date.year, end_date.month
+    while True:
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        cycle_end = date(year, month, min(anchor_day, calendar.monthrange(year, month)[1]))
+        if cycle_end >= today:
+            return start_date, cycle_end
+        start_date = cycle_end + timedelta(days=1)
+
+
+def _lapsed_criteria(subscriptions, today):
+    return [subscriptions.c.status == 'active', subscriptions.c.end_date < today]
+
+
+def run_subscription_lifecycle(job, today=None, auto_renew=True, chunk_size=LIFECYCLE_CHUNK_SIZE):
+    """Expire or renew every active subscription whose end_date has passed
+
+    Lapsed rows are handled one end_date at a time, so the new cycle's dates
+    are plain literals and every chunk is a set-based INSERT ... SELECT plus
+    UPDATE that commits on its own. Handled rows stop being active, which makes
+    a rerun after an interruption pick up exactly where the last one stopped.
+    Renewals end on or after today, so each lapsed row is renewed at most once.
+    """
+    today = today or datetime.now().date()
+    subscriptions = Subscription.__table__
+    lapsed = _lapsed_criteria(subscriptions, today)
+    renewable_plan_ids = [plan_id for (plan_id,) in db.session.query(Plan.id).filter_by(is_active=True)]
+    if not auto_renew:
+        renewable_plan_ids = []
+
+    job.total = sum(scatter_gather(
+        lambda: db.session.query(func.count(Subscription.id)).filter(*lapsed).scalar()
+    ))
+
+    totals = {'renewed': 0, 'expired': 0}
+    for shard_key in each_shard():
+        with use_shard(shard_key):
+            while not job.is_cancelled:
+                end_date = db.session.query(func.min(Subscription.end_date)).filter(*lapsed).scalar()
+                if end_date is None:
+                    break
+                same_end = lapsed + [subscriptions.c.end_date == end_date]
+                renew = same_end + [subscriptions.c.plan_id.in_(renewable_plan_ids)]
+                expire = same_end + [subscriptions.c.plan_id.notin_(renewable_plan_ids)]
+                totals['renewed'] += _process_group(job, renew, end_date, today, chunk_size, renew=True)
+                totals['expired'] += _process_group(job, expire, end_date, today, chunk_size, renew=False)
+
+    dashboard_cache.clear()
+    return totals
+
+
+def _process_group(job, criteria, end_date, today, chunk_size, renew):
+    subscriptions = Subscription.__table__
+    alerts = Alert.__table__
+    plans = Plan.__table__
+    handled = 0
+    last_id = 0
+    while not job.is_cancelled:
+        upper_id = next_chunk_upper_bound(subscriptions.c.id, criteria, last_id, chunk_size)
+        if upper_id is None:
+            break
+
+        now = datetime.utcnow()
+        in_chunk = criteria + [subscriptions.c.id > last_id, subscriptions.c.id <= upper_id]
+        first_alert_id = None
+        if alert_hub.subscriber_count():
+            first_alert_id = db.session.query(func.coalesce(func.max(Alert.id), 0)).scalar()
+
+        if renew:
+            start_date, next_end_date = renewal_cycle(end_date, today)
+            # The new cycle is billed at the plan's current price
+            current_price = select(plans.c.monthly_price).where(
+                plans.c.id == subscriptions.c.plan_id
+            ).scalar_subquery()
+            db.session.execute(insert(subscriptions).from_select(
+                ['user_id', 'plan_id', 'status', 'start_date', 'end_date',
+                 'price_paid', 'created_at', 'updated_at'],
+                select(
+                    subscriptions.c.user_id, subscriptions.c.plan_id, literal('active'),
+                    literal(start_date), literal(next_end_date), current_price,
+                    literal(now), literal(now)
+                ).where(*in_chunk)
+            ))
+            title = 'Plan Renewed'
+            alert_type = 'billing_reminder'
+            message = f'Your plan has been renewed for a new cycle ending on {next_end_date}.'
+        else:
+            title = 'Plan Expired'
+            alert_type = 'plan_expiry'
+            message = f'Your plan expired on {end_date}. Choose a new plan to continue service.'
+
+        db.session.execute(insert(alerts).from_select(
+            ['user_id', 'title', 'message', 'type', 'is_read', 'created_at'],
+            select(
+                subscriptions.c.user_id, literal(title), literal(message),
+                literal(alert_type), literal(False), literal(now)
+            ).where(*in_chunk)
+        ))
+        count = db.session.execute(
+            update(subscriptions).where(*in_chunk).values(status='expired', updated_at=now)
+        ).rowcount
+
+        db.session.add(AuditLog(
+            action='subscriptions_renewed' if renew else 'subscriptions_expired',
+            table_name='subscriptions',
+            old_values={'status': 'active', 'end_date': end_date.isoformat(),
+                        'subscription_ids': [last_id + 1, upper_id]},
+            new_values={'status': 'expired', 'count': count, 'renewed': renew}
+        ))
+        db.session.commit()
+
+        listening = alert_hub.subscribed_user_ids() if first_alert_id is not None else None
+        if listening:
+            # Matched on content: MySQL rounds DATETIME, so created_at may no longer equal now
+            for alert in Alert.query.filter(
+                Alert.id > first_alert_id,
+                Alert.user_id.in_(sorted(listening)),
+                Alert.title == title,
+                Alert.message == message
+            ):
+                alert_hub.publish_alert(alert)
+
+        last_id = upper_id
+        handled += count
+        job.advance(count)
+    return handled
@@ -1,2 +1,118 @@
-# User service - to be implemented
-# This will contain business logic for user operations
+# User service
+# Business logic for user operations
+import calendar
+from datetime import datetime
+from sqlalchemy import and_, func, or_
+from models.users import User
+from models.plans import Plan
+from models.subscriptions import Subscription
+from models.usage import Usage
+from models.discounts import Discount
+from models.alerts import Alert
+from utils.cache import dashboard_cache
+from db import db
+
+
+def _anchor_in_month(anchor_day, year, month):
+    # Clamp anchors like the 31st to the last day of shorter months
+    return datetime(year, month, min(anchor_day, calendar.monthrange(year, month)[1])).date()
+
+
+def current_cycle_start(start_date, today=None):
+    """Return the first day of the billing cycle containing today, anchored on start_date"""
+    today = today or datetime.now().date()
+    if start_date >= today:
+        return start_date
+
+    cycle_start = _anchor_in_month(start_date.day, today.year, today.month)
+    if cycle_start <= today:
+        return cycle_start
+    year, month = (today.year - 1, 12) if today.month == 1 else (today.year, today.month - 1)
+    return _anchor_in_month(start_date.day, year, month)
+
+
+def get_dashboard_snapshot(user_id):
+    """Build the user dashboard payload, served from the per-user cache when fresh"""
+    user_id = int(user_id)
+    snapshot = dashboard_cache.get(user_id)
+    if snapshot is not None:
+        return snapshot
+
+    snapshot = _load_dashboard_snapshot(user_id)
+    if snapshot is not None:
+        dashboard_cache.set(user_id, snapshot)
+    return snapshot
+
+
+def _load_dashboard_snapshot(user_id):
+    today = datetime.now().date()
+
+    unread_alerts = db.session.query(func.count(Alert.id)).filter(
+        Alert.user_id == User.id,
+        Alert.is_read == False
+    ).correlate(User).scalar_subquery()
+
+    discount = db.session.query(func.max(Discount.discount_percentage)).filter(
+        Discount.plan_id == Subscription.plan_id,
+        Discount.is_active == True,
+        Discount.start_date <= today,
+        Discount.end_date >= today
+    ).correlate(Subscription).scalar_subquery()
+
+    # User, active subscription, plan, unread count and discount in one statement
+    row = db.session.query(
+        User,
+        Subscription,
+        Plan,
+        unread_alerts.label('unread_alert_count'),
+        discount.label('discount_percentage')
+    ).outerjoin(
+        Subscription,
+        and_(
+            Subscription.user_id == User.id,
+            Subscription.status == 'active',
+            or_(Subscription.end_date.is_(None), Subscription.end_date >= today)
+        )
+    ).outerjoin(
+        Plan, Plan.id == Subscription.plan_id
+    ).filter(
+        User.id == user_id
+    ).order_by(Subscription.id.desc()).first()
+
+    if row is None:
+        return None
+
+    user, subscription, plan, unread_alert_count, discount_percentage = row
+
+    usage = None
+    if subscription is not None:
+        cycle_start = current_cycle_start(subscription.start_date, today)
+        data_used_gb = db.session.query(
+            func.coalesce(func.sum(Usage.data_used_gb), 0)
+        ).filter(
+            Usage.subscription_id == subscription.id,
+            Usage.usage_date >= cycle_start
+        ).scalar()
+        usage = {
+            'cycle_start': cycle_start.isoformat(),
+            'data_used_gb': float(data_used_gb),
+            'quota_gb': plan.monthly_quota_gb if plan else None
+        }
+
+    effective_discount = None
+    if plan is not None and discount_percentage is not None:
+        percentage = float(discount_percentage)
+        effective_discount = {
+            'discount_percentage': percentage,
+            'effective_price': round(float(plan.monthly_price) * (100 - percentage) / 100, 2)
+        }
+
+    return {
+        'user': user.to_dict(),
+        'has_plan': subscription is not None,
+        'subscription': subscription.to_dict() if subscription else None,
+        'plan': plan.to_dict() if plan else None,
+        'unread_alert_count': unread_alert_count or 0,
+        'usage': usage,
+        'discount': effective_discount
+    }
@@ -0,0 +1,38 @@
+import pytest
+
+from utils.jobs import get_job
+
+# Admin operations that run jobs or expose internals, as (method, path)
+ADMIN_ONLY = [
+    ('POST', '/admin/plans/1/migrate'),
+    ('POST', '/admin/subscriptions/lifecycle'),
+    ('POST', '/admin/alerts/broadcast'),
+    ('GET', '/admin/jobs/unknown'),
+    ('POST', '/admin/jobs/unknown/cancel'),
+    ('GET', '/admin/metrics'),
+    ('GET', '/admin/profiles'),
+    ('POST', '/admin/profiles'),
+    ('GET', '/admin/profiles/1/flamegraph'),
+    ('GET', '/admin/profiles/endpoints/user.get_plans/flamegraph'),
+    ('POST', '/admin/users/import'),
+    ('GET', '/admin/analytics'),
+    ('POST', '/admin/analytics/refresh'),
+]
+
+
+@pytest.mark.parametrize('method, path', ADMIN_ONLY)
+def test_admin_operations_reject_non_admins(client, method, path):
+    assert client.open(path, method=method).status_code == 401
+    assert client.open(path, method=method, headers={'User-ID': 'x'}).status_code == 400
+    # The demo customer is user 2
+    assert client.open(path, method=method, headers={'User-ID': '2'}).status_code == 403
+    assert client.open(path, method=method, headers={'User-ID': '999'}).status_code == 403
+
+
+def test_broadcast_is_attributed_to_the_calling_admin(client):
+    response = client.post('/admin/alerts/broadcast', headers={'User-ID': '1'}, json={
+        'title': 'Maintenance', 'message': 'Down tonight', 'admin_id': 2
+    })
+    assert response.status_code == 202
+    assert response.get_json()['broadcast']['created_by'] == 1
+    get_job(response.get_json()['job']['id']).wait(10)
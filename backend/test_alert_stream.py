@@ -0,0 +1,72 @@
+from datetime import date
+
+import pytest
+
+from db import db
+from models.broadcasts import Broadcast
+from models.subscriptions import Subscription
+from models.users import User
+from routes.user_routes import _alert_stream
+from services.broadcast_service import broadcast_alert
+from services.lifecycle_service import run_subscription_lifecycle
+from utils.jobs import Job
+from utils.pubsub import alert_hub
+
+
+def alert(alert_id):
+    return {'id': alert_id, 'user_id': 2, 'title': f'Alert {alert_id}'}
+
+
+def test_stream_sends_alerts_published_out_of_id_order():
+    listener = alert_hub.subscribe(2)
+    # Alert 5 was committed before the catch-up query and is published again afterwards
+    for alert_id in (7, 5, 6):
+        listener.put(alert(alert_id))
+    stream = _alert_stream(2, listener, [alert(5)], heartbeat_seconds=0.01)
+
+    events = []
+    for chunk in stream:
+        if chunk.startswith(': keep-alive'):
+            break
+        events.append(chunk)
+    stream.close()
+
+    sent = [int(event.split('\n')[0][len('id: '):]) for event in events if event.startswith('id: ')]
+    assert sent == [5, 7, 6]
+    assert alert_hub.subscriber_count() == 0
+
+
+@pytest.fixture
+def published(app, monkeypatch):
+    """User ids of the alerts jobs publish while only the demo customer has a stream open"""
+    user_ids = []
+    monkeypatch.setattr(alert_hub, 'publish_alert', lambda alert: user_ids.append(alert.user_id))
+    listener = alert_hub.subscribe(2)
+    with app.app_context():
+        for index in range(5):
+            user = User(name=f'Customer {index}', email=f'customer{index}@example.com',
+                        password_hash='x', role='user')
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Subscription(user_id=user.id, plan_id=1, status='active', start_date=date(2026, 9, 1),
+                                        end_date=date(2026, 10, 1), price_paid=10))
+        Subscription.query.filter_by(user_id=2).update({'end_date': date(2026, 10, 1)})
+        db.session.commit()
+        yield user_ids
+    alert_hub.unsubscribe(2, listener)
+
+
+def test_broadcast_loads_only_alerts_of_users_with_open_streams(published):
+    broadcast = Broadcast(title='Maintenance', message='Down tonight')
+    db.session.add(broadcast)
+    db.session.commit()
+
+    assert broadcast_alert(Job('alert_broadcast'), broadcast.id, chunk_size=2)['recipients'] == 6
+    assert published == [2]
+
+
+def test_lifecycle_loads_only_alerts_of_users_with_open_streams(published):
+    assert run_subscription_lifecycle(Job('subscription_lifecycle'), today=date(2026, 10, 19)) == {
+        'renewed': 6, 'expired': 0
+    }
+    assert published == [2]
@@ -0,0 +1,51 @@
+from datetime import date, datetime
+
+from db import db
+from models.plans import Plan
+from models.subscriptions import Subscription
+from models.users import User
+from services.analytics_service import _month_index, compute_report, load_arrays
+
+REPORT_MONTH = int(_month_index([date(2026, 3, 1)])[0])
+
+
+def add_customer(email, signed_up, subscriptions=()):
+    user = User(name=email, email=email, password_hash='x', role='user', created_at=signed_up)
+    db.session.add(user)
+    db.session.flush()
+    for plan_id, status, start_date, end_date in subscriptions:
+        db.session.add(Subscription(user_id=user.id, plan_id=plan_id, status=status,
+                                    start_date=start_date, end_date=end_date, price_paid=10))
+
+
+def seed_cohorts():
+    """Two January customers on Basic, one of whom churns in February, and two February sign-ups"""
+    Subscription.query.filter_by(user_id=2).delete()
+    User.query.filter_by(id=2).delete()
+    add_customer('stays@example.com', datetime(2026, 1, 10), [(1, 'active', date(2026, 1, 10), None)])
+    add_customer('churns@example.com', datetime(2026, 1, 20), [(1, 'expired', date(2026, 1, 20), date(2026, 2, 5))])
+    add_customer('browses@example.com', datetime(2026, 2, 3))
+    add_customer('switches@example.com', datetime(2026, 2, 15), [
+        (2, 'cancelled', date(2026, 2, 15), date(2026, 2, 28)),
+        (1, 'active', date(2026, 3, 1), None)
+    ])
+    db.session.commit()
+
+
+def test_cohort_report_matches_known_cohorts(app):
+    with app.app_context():
+        seed_cohorts()
+        plans = {plan.id: plan.name for plan in Plan.query.all()}
+        # Chunks smaller than the tables exercise the per-chunk array conversion
+        report = compute_report(load_arrays(chunk_size=2), plans, REPORT_MONTH, horizon=3, workers=1)
+
+    assert [
+        (cohort['signup_month'], cohort['plan_name'], cohort['size'], cohort['retention'])
+        for cohort in report['cohorts']
+    ] == [
+        ('2026-01', 'Basic Plan', 2, [1.0, 1.0, 0.5]),
+        ('2026-02', 'No plan', 1, [0.0, 0.0, None]),
+        ('2026-02', 'Premium Plan', 1, [1.0, 1.0, None])
+    ]
+    assert report['churn'] == [{'month': '2026-02', 'plan_id': 1, 'plan_name': 'Basic Plan', 'churned': 1}]
+    assert report['totals'] == {'users': 4, 'subscriptions': 4, 'churned_users': 1}
@@ -0,0 +1,65 @@
+import io
+
+from models.subscriptions import Subscription
+from models.users import User
+from services import import_service
+from services.import_service import import_users
+from utils.jobs import Job, get_job
+
+ADMIN = {'User-ID': '1'}
+
+ROWS = (
+    'Name,Email,Password\n'
+    'Ada,ada@corp.example,secret\n'
+    'Bob,bob@corp.example,secret\n'
+    'Ada Again,ada@corp.example,secret\n'
+    'Demo,user@example.com,secret\n'
+    'No Password,nopass@corp.example,\n'
+    'Bad,not-an-email,secret\n'
+)
+
+
+def upload(client, rows=ROWS, **form):
+    data = {'file': (io.BytesIO(rows.encode()), 'employees.csv'), **form}
+    return client.post('/admin/users/import', data=data, headers=ADMIN)
+
+
+def test_import_reports_rejected_rows_and_subscribes_the_rest(app, client):
+    response = upload(client, plan_id='1')
+    assert response.status_code == 202
+    job = get_job(response.get_json()['job']['id'])
+    assert job.wait(10)
+
+    assert job.result['imported'] == 2
+    assert job.result['failed'] == 4
+    assert [(error['row'], error['error']) for error in job.result['errors']] == [
+        (4, 'Duplicate email in file'),
+        (5, 'User with this email already exists'),
+        (6, 'Name, email, and password are required'),
+        (7, 'Invalid email address')
+    ]
+    with app.app_context():
+        for email in ('ada@corp.example', 'bob@corp.example'):
+            user = User.query.filter_by(email=email).one()
+            assert [(row.plan_id, row.status) for row in Subscription.query.filter_by(user_id=user.id)] == [(1, 'active')]
+
+
+def test_import_rejects_a_plan_id_that_is_not_an_integer(client):
+    response = upload(client, plan_id='abc')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Plan ID must be an integer'
+
+
+def test_email_taken_after_the_check_is_reported_per_row(app, tmp_path, monkeypatch):
+    # As if user@example.com signed up between the lookup and the insert
+    monkeypatch.setattr(import_service, '_existing_emails', lambda emails: set())
+    path = tmp_path / 'employees.csv'
+    path.write_text('name,email,password\nAda,ada@corp.example,secret\nDemo,user@example.com,secret\n')
+
+    with app.app_context():
+        result = import_users(Job('user_import'), str(path), workers=1)
+        assert result['imported'] == 1
+        assert result['errors'] == [
+            {'row': 3, 'email': 'user@example.com', 'error': 'User with this email already exists'}
+        ]
+        assert User.query.filter_by(email='ada@corp.example').count() == 1
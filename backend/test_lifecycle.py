@@ -0,0 +1,95 @@
+from datetime import date
+
+from db import db
+from models.alerts import Alert
+from models.plans import Plan
+from models.subscriptions import Subscription
+from models.users import User
+from services.lifecycle_service import renewal_cycle, run_subscription_lifecycle
+from utils.jobs import Job
+
+TODAY = date(2026, 10, 19)
+
+
+class CancelAfterFirstChunk(Job):
+    def advance(self, count):
+        super().advance(count)
+        self.cancel()
+
+
+def add_subscriptions(app, end_dates, plan_id=1, status='active'):
+    """One new customer per end date, each with a single subscription"""
+    with app.app_context():
+        user_ids = []
+        for index, end_date in enumerate(end_dates):
+            user = User(name=f'Customer {index}', email=f'{status}{plan_id}-{index}@example.com',
+                        password_hash='x', role='user')
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Subscription(user_id=user.id, plan_id=plan_id, status=status,
+                                        start_date=date(2024, 1, 1), end_date=end_date, price_paid=10))
+            user_ids.append(user.id)
+        db.session.commit()
+        return user_ids
+
+
+def subscriptions_of(user_id):
+    return [
+        (row.status, row.start_date, row.end_date)
+        for row in Subscription.query.filter_by(user_id=user_id).order_by(Subscription.id)
+    ]
+
+
+def test_renewal_cycles_keep_their_anchor_day():
+    assert renewal_cycle(date(2026, 1, 15), date(2026, 1, 16)) == (date(2026, 1, 16), date(2026, 2, 15))
+    assert renewal_cycle(date(2024, 1, 30), date(2024, 2, 1)) == (date(2024, 1, 31), date(2024, 2, 29))
+    # A month-end cycle clamped into February goes back to the 31st afterwards
+    assert renewal_cycle(date(2024, 2, 29), date(2024, 3, 1)) == (date(2024, 3, 1), date(2024, 3, 31))
+
+
+def test_long_lapsed_subscription_renews_once_into_the_current_cycle(app):
+    [user_id] = add_subscriptions(app, [date(2024, 1, 31)])
+    with app.app_context():
+        result = run_subscription_lifecycle(Job('lifecycle'), today=TODAY)
+
+        assert result == {'renewed': 1, 'expired': 0}
+        assert subscriptions_of(user_id) == [
+            ('expired', date(2024, 1, 1), date(2024, 1, 31)),
+            ('active', date(2026, 10, 1), date(2026, 10, 31))
+        ]
+        assert Alert.query.filter_by(user_id=user_id, title='Plan Renewed').count() == 1
+
+
+def test_subscriptions_on_inactive_plans_expire(app):
+    with app.app_context():
+        db.session.get(Plan, 2).is_active = False
+        db.session.commit()
+    [user_id] = add_subscriptions(app, [date(2026, 10, 1)], plan_id=2)
+    with app.app_context():
+        assert run_subscription_lifecycle(Job('lifecycle'), today=TODAY) == {'renewed': 0, 'expired': 1}
+        assert subscriptions_of(user_id) == [('expired', date(2024, 1, 1), date(2026, 10, 1))]
+        assert Alert.query.filter_by(user_id=user_id, title='Plan Expired').count() == 1
+
+
+def test_rerun_after_cancel_handles_each_subscription_once(app):
+    user_ids = add_subscriptions(app, [date(2026, 10, 5)] * 3)
+    with app.app_context():
+        first = run_subscription_lifecycle(CancelAfterFirstChunk('lifecycle'), today=TODAY, chunk_size=1)
+        assert first == {'renewed': 1, 'expired': 0}
+
+        assert run_subscription_lifecycle(Job('lifecycle'), today=TODAY, chunk_size=1) == {'renewed': 2, 'expired': 0}
+        assert run_subscription_lifecycle(Job('lifecycle'), today=TODAY, chunk_size=1) == {'renewed': 0, 'expired': 0}
+        for user_id in user_ids:
+            assert subscriptions_of(user_id) == [
+                ('expired', date(2024, 1, 1), date(2026, 10, 5)),
+                ('active', date(2026, 10, 6), date(2026, 11, 5))
+            ]
+
+
+def test_current_and_cancelled_subscriptions_are_left_alone(app):
+    [current] = add_subscriptions(app, [TODAY])
+    [cancelled] = add_subscriptions(app, [date(2026, 10, 1)], status='cancelled')
+    with app.app_context():
+        assert run_subscription_lifecycle(Job('lifecycle'), today=TODAY) == {'renewed': 0, 'expired': 0}
+        assert subscriptions_of(current) == [('active', date(2024, 1, 1), TODAY)]
+        assert subscriptions_of(cancelled) == [('cancelled', date(2024, 1, 1), date(2026, 10, 1))]
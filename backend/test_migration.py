@@ -0,0 +1,48 @@
+from datetime import date, datetime, timedelta
+
+from db import db
+from models.audit_logs import AuditLog
+from models.subscriptions import Subscription
+from models.users import User
+from services.admin_service import migrate_plan_subscribers
+from utils.jobs import Job
+
+
+def add_subscriber(email, plan_id, end_date):
+    user = User(name=email, email=email, password_hash='x', role='user')
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(Subscription(user_id=user.id, plan_id=plan_id, status='active',
+                                start_date=date(2026, 1, 1), end_date=end_date, price_paid=29.99))
+    return user
+
+
+def test_migration_moves_current_subscribers_in_audited_chunks(app):
+    today = datetime.now().date()
+    with app.app_context():
+        # The demo customer (user 2) is already on plan 1 with no end date
+        renewing = add_subscriber('renewing@example.com', 1, None)
+        cancelling = add_subscriber('cancelling@example.com', 1, today + timedelta(days=3))
+        lapsed = add_subscriber('lapsed@example.com', 1, today - timedelta(days=3))
+        elsewhere = add_subscriber('elsewhere@example.com', 3, None)
+        db.session.commit()
+
+        result = migrate_plan_subscribers(Job('plan_migration'), 1, 2, admin_id=1, chunk_size=2)
+        assert result == {'migrated': 3, 'chunks': 2}
+
+        for user_id in (2, renewing.id, cancelling.id):
+            rows = Subscription.query.filter_by(user_id=user_id).order_by(Subscription.id).all()
+            assert [(row.plan_id, row.status) for row in rows] == [(1, 'cancelled'), (2, 'active')]
+            assert rows[1].end_date is None
+            assert float(rows[1].price_paid) == 59.99
+
+        # A lapsed cycle is left for the lifecycle job rather than revived on the new plan
+        for user, plan_id in ((lapsed, 1), (elsewhere, 3)):
+            rows = Subscription.query.filter_by(user_id=user.id).all()
+            assert [(row.plan_id, row.status) for row in rows] == [(plan_id, 'active')]
+
+        logs = AuditLog.query.filter_by(action='plan_migrated').order_by(AuditLog.id).all()
+        assert [(log.user_id, log.old_values, log.new_values) for log in logs] == [
+            (1, {'plan_id': 1, 'subscription_ids': [1, 2]}, {'plan_id': 2, 'price_paid': 59.99, 'migrated': 2}),
+            (1, {'plan_id': 1, 'subscription_ids': [3, 3]}, {'plan_id': 2, 'price_paid': 59.99, 'migrated': 1})
+        ]
@@ -0,0 +1,169 @@
+import io
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import create_expiry_alerts
+from db import db
+from models.alerts import Alert
+from models.broadcasts import Broadcast
+from models.subscriptions import Subscription
+from models.users import User
+from services.analytics_service import build_cohort_report
+from utils.jobs import get_job
+from utils.profiler import profiler
+
+# Demo data from create_app(): admin is user 1, the demo customer is user 2 on plan 1
+USER = {'User-ID': '2'}
+ADMIN = {'User-ID': '1'}
+
+
+def seed_alerts(app, client):
+    """Several alerts, one sharing its body with a broadcast, so listings expose N+1 loads"""
+    with app.app_context():
+        broadcast = Broadcast(title='Maintenance', message='Down tonight')
+        db.session.add(broadcast)
+        db.session.flush()
+        alerts = [
+            Alert(user_id=2, title=f'Alert {index}', message=f'Message {index}', type='system')
+            for index in range(4)
+        ]
+        alerts.append(Alert(user_id=2, title='Maintenance', message='', type='system', broadcast_id=broadcast.id))
+        db.session.add_all(alerts)
+        db.session.commit()
+        return {'alert_id': alerts[0].id}
+
+
+def start_job(app, client):
+    response = client.post('/admin/subscriptions/lifecycle', json={}, headers=ADMIN)
+    job = get_job(response.get_json()['job']['id'])
+    job.wait(10)
+    return {'job_id': job.id}
+
+
+def arm_capture(app, client):
+    return {'capture_id': profiler.capture('user.get_plans', 1).id}
+
+
+def record_samples(app, client):
+    profiler.endpoint_stacks.setdefault('user.get_plans', Counter())['get_plans (user_routes.py:1)'] += 1
+    return {}
+
+
+def build_report(app, client):
+    with app.app_context():
+        build_cohort_report(workers=1)
+    return {}
+
+
+def csv_upload():
+    rows = 'name,email,password\nAda,ada@corp.example,secret\nBob,bob@corp.example,secret\n'
+    return {'file': (io.BytesIO(rows.encode()), 'employees.csv')}
+
+
+# endpoint: (method, path, request options, maximum SQL statements, setup)
+BUDGETS = {
+    'user.user_signup': ('POST', '/user/signup', {'json': {
+        'name': 'New User', 'email': 'new@example.com', 'password': 'secret'
+    }}, 3, None),
+    'user.user_login': ('POST', '/user/login', {'json': {
+        'email': 'user@example.com', 'password': 'user123'
+    }}, 2, None),
+    'user.get_plans': ('GET', '/user/plans', {}, 1, None),
+    'user.get_plan_details': ('GET', '/user/plans/1', {}, 1, None),
+    'user.get_my_plan': ('GET', '/user/my-plan', {'headers': USER}, 1, None),
+    'user.purchase_plan': ('POST', '/user/purchase-plan', {'json': {'user_id': 2, 'plan_id': 3}}, 5, None),
+    'user.cancel_plan': ('POST', '/user/cancel-plan', {'json': {'user_id': 2}}, 4, None),
+    'user.get_user_alerts': ('GET', '/user/alerts', {'headers': USER}, 2, seed_alerts),
+    'user.stream_user_alerts': ('GET', '/user/alerts/stream?user_id=2&last_event_id=0', {}, 2, seed_alerts),
+    'user.mark_alert_read': ('PUT', '/user/alerts/{alert_id}/read', {'headers': USER}, 2, seed_alerts),
+    'user.user_dashboard': ('GET', '/user/dashboard', {'headers': USER}, 2, seed_alerts),
+    'user.my_subscriptions': ('GET', '/user/subscriptions', {}, 0, None),
+    'user.plan_recommendations': ('GET', '/user/recommendations', {}, 0, None),
+    'user.usage_history': ('GET', '/user/usage', {}, 0, None),
+    'user.billing': ('GET', '/user/billing', {}, 0, None),
+    'admin.admin_login': ('POST', '/admin/login', {'json': {
+        'email': 'admin@example.com', 'password': 'admin123'
+    }}, 2, None),
+    'admin.admin_dashboard': ('GET', '/admin/dashboard', {}, 0, None),
+    'admin.manage_plans': ('GET', '/admin/plans', {}, 0, None),
+    'admin.manage_discounts': ('GET', '/admin/discounts', {}, 0, None),
+    'admin.manage_users': ('GET', '/admin/users', {}, 1, None),
+    'admin.import_users_csv': ('POST', '/admin/users/import', {'data': csv_upload, 'headers': ADMIN}, 1, None),
+    'admin.migrate_plan': ('POST', '/admin/plans/1/migrate', {'json': {'target_plan_id': 2}, 'headers': ADMIN}, 3, None),
+    'admin.run_lifecycle': ('POST', '/admin/subscriptions/lifecycle', {'json': {}, 'headers': ADMIN}, 1, None),
+    'admin.broadcast': ('POST', '/admin/alerts/broadcast', {'json': {
+        'title': 'Maintenance', 'message': 'Down tonight'
+    }, 'headers': ADMIN}, 3, None),
+    'admin.job_status': ('GET', '/admin/jobs/{job_id}', {'headers': ADMIN}, 1, start_job),
+    'admin.cancel_job': ('POST', '/admin/jobs/{job_id}/cancel', {'headers': ADMIN}, 1, start_job),
+    'admin.metrics': ('GET', '/admin/metrics', {'headers': ADMIN}, 1, None),
+    'admin.profiles': ('GET', '/admin/profiles', {'headers': ADMIN}, 1, None),
+    'admin.capture_flamegraph': ('GET', '/admin/profiles/{capture_id}/flamegraph', {'headers': ADMIN}, 1, arm_capture),
+    'admin.endpoint_flamegraph': ('GET', '/admin/profiles/endpoints/user.get_plans/flamegraph', {'headers': ADMIN}, 1,
+                                  record_samples),
+    'admin.analytics': ('GET', '/admin/analytics', {'headers': ADMIN}, 2, build_report),
+    'admin.refresh_analytics': ('POST', '/admin/analytics/refresh', {'headers': ADMIN}, 1, None),
+}
+
+
+def test_every_endpoint_has_a_query_budget(app):
+    assert set(app.view_functions) - {'static'} == set(BUDGETS)
+
+
+@pytest.mark.parametrize('endpoint', sorted(BUDGETS))
+def test_endpoint_stays_within_query_budget(app, client, max_queries, endpoint):
+    method, path, options, budget, setup = BUDGETS[endpoint]
+    values = setup(app, client) if setup else {}
+    options = {key: value() if callable(value) else value for key, value in options.items()}
+
+    with max_queries(budget):
+        response = client.open(path.format(**values), method=method, buffered=False, **options)
+    response.close()
+
+    assert response.status_code < 400
+    job = (response.get_json(silent=True) or {}).get('job') if response.is_json else None
+    if job:
+        # Let the background work finish before the in-memory database goes away
+        get_job(job['id']).wait(10)
+
+
+def add_expiring_subscriptions(app, count):
+    alert_date = datetime.now().date() + timedelta(days=2)
+    with app.app_context():
+        for index in range(count):
+            user = User(name=f'Expiring {index}', email=f'expiring{index}@example.com',
+                        password_hash='x', role='user')
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Subscription(user_id=user.id, plan_id=1 + index % 3, status='active',
+                                        start_date=alert_date - timedelta(days=28), end_date=alert_date,
+                                        price_paid=10))
+        db.session.commit()
+
+
+@pytest.mark.parametrize('count', [2, 20])
+def test_expiry_alerts_take_the_same_queries_for_any_number_of_subscriptions(app, max_queries, count):
+    add_expiring_subscriptions(app, count)
+    with app.app_context():
+        with max_queries(3):
+            create_expiry_alerts()
+        assert Alert.query.filter_by(title='Plan Expiring Soon').count() == count
+
+        # A second run finds the existing alerts and creates none
+        create_expiry_alerts()
+        assert Alert.query.filter_by(title='Plan Expiring Soon').count() == count
+
+
+def test_expiry_alerts_are_sent_again_for_the_next_cycle(app):
+    add_expiring_subscriptions(app, 2)
+    with app.app_context():
+        # Last cycle's warning, sent a month before this end date
+        db.session.add(Alert(user_id=User.query.filter_by(email='expiring0@example.com').one().id,
+                             title='Plan Expiring Soon', message='Last cycle', type='plan_expiry',
+                             created_at=datetime.utcnow() - timedelta(days=30)))
+        db.session.commit()
+
+        create_expiry_alerts()
+        assert Alert.query.filter_by(title='Plan Expiring Soon').count() == 3
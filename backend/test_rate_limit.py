@@ -0,0 +1,75 @@
+import pytest
+
+from app import create_app
+from utils.cache import dashboard_cache
+from utils.rate_limit import MemoryBucketStore, SQLiteBucketStore
+
+ADMIN = {'User-ID': '1'}
+WRONG = {'email': 'user@example.com', 'password': 'wrong'}
+
+
+@pytest.fixture
+def app():
+    """Like the shared fixture but with a login burst of 3 and no refill during the test"""
+    dashboard_cache.clear()
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'SQLALCHEMY_BINDS': {},
+        'SQLITE_REPLICA_COUNT': 0,
+        'RATELIMIT_ENABLED': True,
+        'LOGIN_RATELIMIT_BURST': 3,
+        'LOGIN_RATELIMIT_PER_MINUTE': 0.001
+    })
+
+
+def login(client, ip='10.0.0.1', **json):
+    return client.post('/user/login', json=json or WRONG, environ_base={'REMOTE_ADDR': ip})
+
+
+def test_over_limit_login_is_rejected_before_any_query(client, max_queries):
+    assert [login(client).status_code for _ in range(3)] == [401, 401, 401]
+
+    with max_queries(0):
+        response = login(client)
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+
+
+def test_email_bucket_limits_attempts_spread_across_addresses(client):
+    statuses = [login(client, ip=f'10.0.0.{index}').status_code for index in range(4)]
+    assert statuses == [401, 401, 401, 429]
+
+    # Another account from a fresh address is unaffected
+    other = {'email': 'someone@example.com', 'password': 'wrong'}
+    assert login(client, ip='10.0.1.1', **other).status_code == 401
+
+
+def test_metrics_count_allowed_and_rejected_attempts(client):
+    for _ in range(4):
+        login(client)
+
+    metrics = client.get('/admin/metrics', headers=ADMIN).get_json()['rate_limits']['login']
+    assert metrics['capacity'] == 3
+    assert metrics['store'] == 'MemoryBucketStore'
+    assert metrics['counters'] == {
+        'ip': {'allowed': 3, 'rejected': 1},
+        'email': {'allowed': 3, 'rejected': 1}
+    }
+
+
+@pytest.mark.parametrize('make_stores', [
+    lambda tmp_path: [MemoryBucketStore()] * 2,
+    # Two workers opening the same file share their buckets
+    lambda tmp_path: [SQLiteBucketStore(str(tmp_path / 'buckets.db')) for _ in range(2)]
+])
+def test_bucket_stores_spend_and_refill_tokens(tmp_path, make_stores):
+    first, second = make_stores(tmp_path)
+    assert first.take('ip:a', 2, 1.0, now=100)[0] is True
+    assert second.take('ip:a', 2, 1.0, now=100)[0] is True
+    assert first.take('ip:a', 2, 1.0, now=100)[0] is False
+    # Other keys keep their own bucket
+    assert second.take('ip:b', 2, 1.0, now=100)[0] is True
+
+    # One token back after a second at one token per second
+    assert second.take('ip:a', 2, 1.0, now=101)[0] is True
+    assert first.take('ip:a', 2, 1.0, now=101)[0] is False
@@ -0,0 +1,58 @@
+import time
+
+from app import create_app
+from db import RECENT_WRITE_COOKIE
+
+
+def make_worker(tmp_path):
+    """An app process on a shared SQLite primary with two stand-in replicas that never catch up"""
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/primary.db',
+        'SQLALCHEMY_BINDS': {},
+        'SQLITE_REPLICA_COUNT': 2,
+        'SQLITE_REPLICA_LAG_SECONDS': 600,
+        'RATELIMIT_ENABLED': False
+    })
+
+
+def buy_plan(client, user_id=2):
+    """The demo customer moves to plan 3, which the replicas have not seen"""
+    response = client.post('/user/purchase-plan', json={'user_id': user_id, 'plan_id': 3})
+    assert response.status_code == 201
+
+
+def plan_id(client, user_id=2):
+    return client.get('/user/my-plan', headers={'User-ID': str(user_id)}).get_json()['plan']['id']
+
+
+def test_reads_without_a_recent_write_go_to_a_replica(tmp_path):
+    app = make_worker(tmp_path)
+    buy_plan(app.test_client())
+
+    # A client that did not write reads the stale replica copy
+    assert plan_id(app.test_client()) == 1
+
+
+def test_recent_writer_reads_from_the_primary_on_any_worker(tmp_path):
+    worker_a = make_worker(tmp_path)
+    worker_b = make_worker(tmp_path)
+
+    client = worker_a.test_client()
+    buy_plan(client)
+    assert plan_id(client) == 3
+
+    # The same browser reaching another worker presents the cookie it was given
+    other = worker_b.test_client()
+    other.set_cookie(RECENT_WRITE_COOKIE, client.get_cookie(RECENT_WRITE_COOKIE).value)
+    assert plan_id(other) == 3
+
+
+def test_write_cookie_only_covers_its_user_until_it_expires(tmp_path):
+    app = make_worker(tmp_path)
+    buy_plan(app.test_client())
+
+    client = app.test_client()
+    client.set_cookie(RECENT_WRITE_COOKIE, f'1:{time.time() + 60}')
+    assert plan_id(client) == 1
+    client.set_cookie(RECENT_WRITE_COOKIE, '2:0')
+    assert plan_id(client) == 1
@@ -0,0 +1,157 @@
+import sqlite3
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app import create_app
+from db import db, shard_key_for_user
+from models.users import User
+from utils.sharding import allocate_user_id, rebalance_shards
+
+
+def make_app(tmp_path, shard_count):
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/primary.db',
+        'SQLALCHEMY_BINDS': {
+            f'shard_{index}': f'sqlite:///{tmp_path}/shard_{index}.db'
+            for index in range(shard_count)
+        },
+        'RATELIMIT_ENABLED': False
+    })
+
+
+def shard_user_ids(tmp_path, index):
+    conn = sqlite3.connect(tmp_path / f'shard_{index}.db')
+    try:
+        return {row[0] for row in conn.execute('SELECT id FROM users')}
+    finally:
+        conn.close()
+
+
+def signup(client, count):
+    ids = []
+    for index in range(count):
+        response = client.post('/user/signup', json={
+            'name': f'Employee {index}',
+            'email': f'employee{index}@example.com',
+            'password': 'secret'
+        })
+        assert response.status_code == 201
+        ids.append(response.get_json()['user']['id'])
+    return ids
+
+
+def test_users_are_stored_on_their_hashed_shard(tmp_path):
+    app = make_app(tmp_path, 3)
+    ids = signup(app.test_client(), 12)
+
+    keys = ['shard_0', 'shard_1', 'shard_2']
+    assert len(set(ids)) == len(ids)
+    for index, key in enumerate(keys):
+        expected = {user_id for user_id in ids if shard_key_for_user(user_id, keys) == key}
+        assert expected <= shard_user_ids(tmp_path, index)
+
+
+def test_user_routes_read_from_the_owning_shard(tmp_path):
+    app = make_app(tmp_path, 3)
+    client = app.test_client()
+    user_id = signup(client, 5)[-1]
+
+    response = client.post('/user/login', json={'email': 'employee4@example.com', 'password': 'secret'})
+    assert response.status_code == 200
+    assert response.get_json()['user']['id'] == user_id
+
+    assert client.post('/user/purchase-plan', json={'user_id': user_id, 'plan_id': 1}).status_code == 201
+    dashboard = client.get('/user/dashboard', headers={'User-ID': str(user_id)}).get_json()
+    assert dashboard['has_plan'] is True
+    assert dashboard['plan']['id'] == 1
+
+    duplicate = client.post('/user/signup', json={
+        'name': 'Again', 'email': 'employee4@example.com', 'password': 'secret'
+    })
+    assert duplicate.status_code == 400
+
+
+def test_alert_stream_finds_the_user_from_the_query_string(tmp_path):
+    app = make_app(tmp_path, 3)
+    client = app.test_client()
+    # EventSource cannot send a User-ID header, so the stream is routed by ?user_id=
+    for user_id in signup(client, 6):
+        response = client.get(f'/user/alerts/stream?user_id={user_id}&last_event_id=0', buffered=False)
+        assert response.status_code == 200
+        response.close()
+
+
+def test_queries_without_a_chosen_shard_are_refused(tmp_path):
+    app = make_app(tmp_path, 2)
+    with app.app_context():
+        with pytest.raises(RuntimeError):
+            User.query.count()
+
+
+def test_plans_are_replicated_to_every_shard(tmp_path):
+    make_app(tmp_path, 2)
+    for index in range(2):
+        conn = sqlite3.connect(tmp_path / f'shard_{index}.db')
+        assert conn.execute('SELECT COUNT(*) FROM plans').fetchone()[0] == 10
+        conn.close()
+
+
+def test_admin_user_listing_gathers_all_shards(tmp_path):
+    app = make_app(tmp_path, 3)
+    client = app.test_client()
+    ids = signup(client, 6)
+
+    users = client.get('/admin/users').get_json()['users']
+    assert [user['id'] for user in users] == sorted([1, 2] + ids)
+
+    page = client.get('/admin/users?limit=3&after_id=2').get_json()
+    assert [user['id'] for user in page['users']] == sorted(ids)[:3]
+    assert page['next_after_id'] == sorted(ids)[2]
+
+
+def test_rebalance_moves_users_and_their_rows_onto_new_shards(tmp_path):
+    app = make_app(tmp_path, 2)
+    client = app.test_client()
+    ids = signup(client, 10)
+    for user_id in ids:
+        assert client.post('/user/purchase-plan', json={'user_id': user_id, 'plan_id': 2}).status_code == 201
+
+    app = make_app(tmp_path, 4)
+    with app.app_context():
+        moved = rebalance_shards(log=lambda message: None)
+        assert moved > 0
+        assert rebalance_shards(log=lambda message: None) == 0
+
+    keys = [f'shard_{index}' for index in range(4)]
+    for index, key in enumerate(keys):
+        stored = shard_user_ids(tmp_path, index)
+        assert all(shard_key_for_user(user_id, keys) == key for user_id in stored)
+
+    # Audit logs still point at each user's subscription, renumbered or not
+    for index in range(4):
+        conn = sqlite3.connect(tmp_path / f'shard_{index}.db')
+        try:
+            logged = set(conn.execute("SELECT user_id, record_id FROM audit_logs WHERE table_name = 'subscriptions'"))
+            stored = set(conn.execute('SELECT user_id, id FROM subscriptions'))
+        finally:
+            conn.close()
+        assert logged <= stored
+
+    client = app.test_client()
+    for user_id in ids:
+        plan = client.get('/user/my-plan', headers={'User-ID': str(user_id)}).get_json()
+        assert plan['has_plan'] is True
+        assert plan['plan']['id'] == 2
+
+
+def test_email_is_unique_across_shards(tmp_path):
+    app = make_app(tmp_path, 3)
+    client = app.test_client()
+    signup(client, 1)
+
+    # The registry rejects the email even when the new id hashes onto another shard
+    with app.app_context():
+        with pytest.raises(IntegrityError):
+            with db.engine.begin() as connection:
+                allocate_user_id(connection, 'employee0@example.com')
@@ -0,0 +1,50 @@
+import threading
+import time
+
+
+class TTLCache:
+    """Small thread-safe in-process cache whose entries expire after a fixed TTL"""
+
+    def __init__(self, ttl_seconds=30, max_entries=10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.max_entries:
+                # Dicts keep insertion order, so the first key is the oldest entry
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Per-user dashboard snapshots, invalidated by purchase, cancel and alert writes
+dashboard_cache = TTLCache()
+
+
+def invalidate_user_dashboard(user_id):
+    """Drop the cached dashboard snapshot for a user after one of their rows changes"""
+    try:
+        dashboard_cache.invalidate(int(user_id))
+    except (TypeError, ValueError):
+        pass
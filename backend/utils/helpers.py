@@ -1,2 +1,16 @@
-# Helper utilities - to be implemented
-# This will contain common utility functions
+# Helper utilities
+# Common utility functions shared by routes and services
+from sqlalchemy import func, select
+from db import db
+
+
+def next_chunk_upper_bound(id_column, criteria, last_id, chunk_size):
+    """Return the highest id of the next chunk of rows after last_id, or None when done
+
+    Walking id ranges keeps every chunked statement on the primary key index,
+    so each batch touches at most chunk_size rows and holds its locks briefly.
+    """
+    chunk = select(id_column.label('id')).where(
+        *criteria, id_column > last_id
+    ).order_by(id_column).limit(chunk_size).subquery()
+    return db.session.execute(select(func.max(chunk.c.id))).scalar()
@@ -0,0 +1,82 @@
+import threading
+import uuid
+from datetime import datetime
+from db import db
+
+
+class Job:
+    """Progress and cancellation state for a long-running background operation"""
+
+    def __init__(self, kind, params=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params or {}
+        self.status = 'pending'
+        self.total = None
+        self.processed = 0
+        self.result = None
+        self.error = None
+        self.created_at = datetime.utcnow()
+        self.finished_at = None
+        self._cancel_requested = threading.Event()
+        self._done = threading.Event()
+
+    @property
+    def is_cancelled(self):
+        return self._cancel_requested.is_set()
+
+    def cancel(self):
+        self._cancel_requested.set()
+
+    def advance(self, count):
+        self.processed += count
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'params': self.params,
+            'status': self.status,
+            'total': self.total,
+            'processed': self.processed,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def start_job(app, kind, target, params=None):
+    """Run target(job) on a daemon thread inside an app context and register the job"""
+    job = Job(kind, params)
+    with _jobs_lock:
+        _jobs[job.id] = job
+
+    def run():
+        with app.app_context():
+            job.status = 'running'
+            try:
+                job.result = target(job)
+                job.status = 'cancelled' if job.is_cancelled else 'completed'
+            except Exception as e:
+                db.session.rollback()
+                job.error = str(e)
+                job.status = 'failed'
+            finally:
+                job.finished_at = datetime.utcnow()
+                job._done.set()
+
+    threading.Thread(target=run, name=f'{kind}-{job.id}', daemon=True).start()
+    return job
+
+
+def get_job(job_id):
+    with _jobs_lock:
+        return _jobs.get(job_id)
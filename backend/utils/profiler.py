@@ -0,0 +1,160 @@
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from flask import request
+
+
+class ProfileCapture:
+    """Folded stacks sampled from the next N requests to one endpoint"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, endpoint, requests):
+        self.id = next(self._ids)
+        self.endpoint = endpoint
+        self.requested = requests
+        self.remaining = requests
+        self.completed = 0
+        self.stacks = Counter()
+        self.created_at = datetime.utcnow()
+
+    @property
+    def status(self):
+        return 'complete' if self.completed >= self.requested else 'capturing'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'endpoint': self.endpoint,
+            'requests': self.requested,
+            'completed_requests': self.completed,
+            'samples': sum(self.stacks.values()),
+            'status': self.status,
+            'created_at': self.created_at.isoformat()
+        }
+
+
+def folded(stacks):
+    """Render stacks in the collapsed format read by flamegraph.pl and speedscope"""
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class SamplingProfiler:
+    """Samples the Python stacks of threads serving profiled requests
+
+    Nothing runs while no capture is armed and always-on mode is off: the
+    request hooks only check one attribute and the sampler thread is stopped.
+    """
+
+    def __init__(self, interval_seconds=0.005):
+        self.interval_seconds = interval_seconds
+        self.always_on = False
+        self.captures = {}
+        self.endpoint_stacks = {}
+        self._armed = {}
+        self._active = {}
+        self._lock = threading.Lock()
+        self._sampler = None
+
+    def init_app(self, app):
+        self.interval_seconds = app.config['PROFILER_INTERVAL_MS'] / 1000.0
+        self.always_on = app.config['PROFILER_ALWAYS_ON']
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    def capture(self, endpoint, requests):
+        """Arm a capture of the next `requests` requests served by endpoint"""
+        capture = ProfileCapture(endpoint, requests)
+        with self._lock:
+            self.captures[capture.id] = capture
+            self._armed.setdefault(endpoint, []).append(capture)
+        return capture
+
+    def summary(self):
+        """Captures and per-endpoint sample totals, read under the sampler's lock"""
+        with self._lock:
+            return {
+                'captures': [capture.to_dict() for capture in self.captures.values()],
+                'endpoints': {
+                    endpoint: sum(stacks.values())
+                    for endpoint, stacks in self.endpoint_stacks.items()
+                }
+            }
+
+    def describe(self, capture):
+        """capture.to_dict() without racing the sampler for its stacks"""
+        with self._lock:
+            return capture.to_dict()
+
+    def snapshot(self, stacks):
+        """Copy of a capture's or endpoint's stacks the sampler can keep adding to"""
+        with self._lock:
+            return Counter(stacks or ())
+
+    def _before_request(self):
+        if not self._armed and not self.always_on:
+            return
+        endpoint = request.endpoint
+        with self._lock:
+            targets = []
+            for capture in self._armed.get(endpoint, []):
+                capture.remaining -= 1
+                targets.append(capture)
+            self._armed[endpoint] = [c for c in self._armed.get(endpoint, []) if c.remaining > 0]
+            if not self._armed[endpoint]:
+                del self._armed[endpoint]
+            if not targets and not self.always_on:
+                return
+            self._active[threading.get_ident()] = (endpoint, targets)
+            self._ensure_sampler()
+
+    def _teardown_request(self, exc):
+        if not self._active:
+            return
+        with self._lock:
+            entry = self._active.pop(threading.get_ident(), None)
+            if entry is not None:
+                for capture in entry[1]:
+                    capture.completed += 1
+
+    def _ensure_sampler(self):
+        if self._sampler is None or not self._sampler.is_alive():
+            self._sampler = threading.Thread(target=self._sample_loop, name='sampling-profiler', daemon=True)
+            self._sampler.start()
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.interval_seconds)
+            with self._lock:
+                # Stop between profiled requests; the next one starts a fresh sampler
+                if not self._active:
+                    self._sampler = None
+                    return
+                active = list(self._active.items())
+            frames = sys._current_frames()
+            for thread_id, (endpoint, targets) in active:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack = ';'.join(reversed(labels))
+                with self._lock:
+                    if self.always_on:
+                        self.endpoint_stacks.setdefault(endpoint, Counter())[stack] += 1
+                    for capture in targets:
+                        capture.stacks[stack] += 1
+
+
+profiler = SamplingProfiler()
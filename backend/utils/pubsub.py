@@ -0,0 +1,75 @@
+import queue
+import threading
+
+
+class LocalBroker:
+    """In-process fan-out standing in for a shared broker such as Redis pub/sub
+
+    A multi-worker deployment swaps this for a broker with the same
+    publish/listen interface so every worker's hub sees every message.
+    """
+
+    def __init__(self):
+        self._listeners = []
+
+    def listen(self, callback):
+        self._listeners.append(callback)
+
+    def publish(self, user_id, event):
+        for callback in list(self._listeners):
+            callback(user_id, event)
+
+
+class AlertHub:
+    """Pushes new alerts to the SSE streams a user has open on this worker"""
+
+    def __init__(self, broker=None, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self.broker = broker or LocalBroker()
+        self.broker.listen(self._deliver)
+
+    def subscribe(self, user_id):
+        listener = queue.Queue(maxsize=self.queue_size)
+        listener.overflowed = False
+        with self._lock:
+            self._subscribers.setdefault(int(user_id), set()).add(listener)
+        return listener
+
+    def unsubscribe(self, user_id, listener):
+        with self._lock:
+            listeners = self._subscribers.get(int(user_id))
+            if listeners is not None:
+                listeners.discard(listener)
+                if not listeners:
+                    del self._subscribers[int(user_id)]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(listeners) for listeners in self._subscribers.values())
+
+    def subscribed_user_ids(self):
+        """Users with an open stream, so bulk jobs load only the alerts someone will receive"""
+        with self._lock:
+            return set(self._subscribers)
+
+    def publish(self, user_id, event):
+        self.broker.publish(int(user_id), event)
+
+    def publish_alert(self, alert):
+        """Announce a committed Alert row to its owner's open streams"""
+        self.publish(alert.user_id, alert.to_dict())
+
+    def _deliver(self, user_id, event):
+        with self._lock:
+            listeners = list(self._subscribers.get(user_id, ()))
+        for listener in listeners:
+            try:
+                listener.put_nowait(event)
+            except queue.Full:
+                # The stream closes and the client resumes from its Last-Event-ID
+                listener.overflowed = True
+
+
+alert_hub = AlertHub()
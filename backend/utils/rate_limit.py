@@ -0,0 +1,147 @@
+import sqlite3
+import threading
+import time
+from functools import wraps
+from flask import request, jsonify
+
+
+def _refill(tokens, updated, now, capacity, refill_per_second):
+    return min(capacity, tokens + (now - updated) * refill_per_second)
+
+
+class MemoryBucketStore:
+    """Token buckets kept in this process only"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill_per_second, now):
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = _refill(tokens, updated, now, capacity, refill_per_second)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            if key not in self._buckets and len(self._buckets) >= self.max_keys:
+                self._prune(capacity, refill_per_second, now)
+            self._buckets[key] = (tokens, now)
+            return allowed, tokens
+
+    def _prune(self, capacity, refill_per_second, now):
+        # A bucket that has refilled completely carries no state worth keeping
+        full = [
+            key for key, (tokens, updated) in self._buckets.items()
+            if _refill(tokens, updated, now, capacity, refill_per_second) >= capacity
+        ]
+        for key in full:
+            del self._buckets[key]
+
+
+class SQLiteBucketStore:
+    """Token buckets in a SQLite file shared by every worker process on the host"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS rate_limit_buckets '
+            '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)'
+        )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, capacity, refill_per_second, now):
+        conn = self._connection()
+        # IMMEDIATE takes the write lock up front so read-modify-write is atomic across workers
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT tokens, updated FROM rate_limit_buckets WHERE key = ?', (key,)
+            ).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens = _refill(tokens, updated, now, capacity, refill_per_second)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute(
+                'INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                (key, tokens, now)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, tokens
+
+
+class RateLimiter:
+    """Token-bucket limiter keyed by client IP and by submitted email"""
+
+    def __init__(self, capacity=10, refill_per_second=10 / 60.0, store=None):
+        self.enabled = True
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.store = store or MemoryBucketStore()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config['RATELIMIT_ENABLED']
+        self.capacity = app.config['LOGIN_RATELIMIT_BURST']
+        self.refill_per_second = app.config['LOGIN_RATELIMIT_PER_MINUTE'] / 60.0
+        if app.config['RATELIMIT_SQLITE_PATH']:
+            self.store = SQLiteBucketStore(app.config['RATELIMIT_SQLITE_PATH'])
+        else:
+            self.store = MemoryBucketStore()
+        with self._lock:
+            self._counters = {}
+
+    def hit(self, scope, value):
+        """Consume one token for scope:value and return whether the attempt may proceed"""
+        allowed, _ = self.store.take(
+            f'{scope}:{value}', self.capacity, self.refill_per_second, time.time()
+        )
+        with self._lock:
+            counters = self._counters.setdefault(scope, {'allowed': 0, 'rejected': 0})
+            counters['allowed' if allowed else 'rejected'] += 1
+        return allowed
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'capacity': self.capacity,
+                'refill_per_second': self.refill_per_second,
+                'store': type(self.store).__name__,
+                'counters': {scope: dict(c) for scope, c in self._counters.items()}
+            }
+
+    def limit(self, view):
+        """Reject over-limit requests before the view runs any query or password hash"""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if self.enabled:
+                data = request.get_json(silent=True)
+                if not isinstance(data, dict):
+                    data = {}
+                email = str(data.get('email') or '').strip().lower()
+                # Evaluate both buckets so each key is charged for the attempt
+                allowed = self.hit('ip', request.remote_addr or 'unknown')
+                if email:
+                    allowed = self.hit('email', email) and allowed
+                if not allowed:
+                    response = jsonify({'error': 'Too many login attempts, please try again later'})
+                    response.headers['Retry-After'] = str(max(1, int(round(1 / self.refill_per_second))))
+                    return response, 429
+            return view(*args, **kwargs)
+        return wrapper
+
+
+login_limiter = RateLimiter()
@@ -0,0 +1,82 @@
+import os
+import sqlite3
+import threading
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from db import REPLICA_BIND_PREFIX, db, replica_bind_keys
+
+
+def _sqlite_file(uri):
+    url = make_url(uri)
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        return None
+    return url.database
+
+
+def add_sqlite_replica_binds(app, count):
+    """Register count file copies of a SQLite primary as stand-in replica binds for local testing"""
+    primary = _sqlite_file(app.config['SQLALCHEMY_DATABASE_URI'])
+    if primary is None or count <= 0:
+        return
+
+    stem, suffix = os.path.splitext(primary)
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for index in range(count):
+        binds[f'{REPLICA_BIND_PREFIX}{index}'] = f'sqlite:///{stem}.replica{index}{suffix}'
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def refresh_sqlite_replicas(app):
+    """Copy the SQLite primary over each SQLite replica file, simulating replication catching up
+
+    File paths come from the engines, which resolve relative SQLite URLs under
+    the app's instance folder, rather than from the configured URLs.
+    """
+    if _sqlite_file(app.config['SQLALCHEMY_DATABASE_URI']) is None:
+        return
+    primary = _sqlite_file(str(db.engine.url))
+
+    source = sqlite3.connect(primary)
+    try:
+        for key in replica_bind_keys(app):
+            replica = _sqlite_file(str(db.engines[key].url))
+            if replica is None:
+                continue
+            target = sqlite3.connect(replica)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+    finally:
+        source.close()
+
+
+def init_sqlite_replica_refresh(app, lag_seconds):
+    """Refresh the stand-in replicas lag_seconds after commits on the primary
+
+    Keeps them behaving like real replicas that trail the primary by a bounded
+    delay, instead of freezing at the startup copy. Commits inside the delay
+    share one refresh.
+    """
+    if _sqlite_file(app.config['SQLALCHEMY_DATABASE_URI']) is None or not replica_bind_keys(app):
+        return
+
+    lock = threading.Lock()
+    pending = []
+
+    def refresh():
+        with lock:
+            pending.clear()
+        with app.app_context():
+            refresh_sqlite_replicas(app)
+
+    def schedule(connection):
+        with lock:
+            if pending:
+                return
+            timer = threading.Timer(lag_seconds, refresh)
+            timer.daemon = True
+            pending.append(timer)
+        timer.start()
+
+    event.listen(db.engine, 'commit', schedule)
@@ -0,0 +1,335 @@
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask import current_app, g, request
+from sqlalchemy import delete, func, insert, select, update
+from db import db, request_user_id, shard_bind_keys, shard_key_for_user, use_shard
+from models.users import User
+from models.plans import Plan
+from models.subscriptions import Subscription
+from models.usage import Usage
+from models.discounts import Discount
+from models.alerts import Alert
+from models.audit_logs import AuditLog
+from models.broadcasts import Broadcast
+
+# Lives on the primary: shards cannot share an autoincrement for users.id
+user_id_sequence = db.Table('user_id_sequence', db.Column('id', db.Integer, primary_key=True))
+
+# Lives on the primary: a shard's UNIQUE(email) cannot see users hashed onto other shards
+user_emails = db.Table(
+    'user_emails',
+    db.Column('email', db.String(255), primary_key=True),
+    db.Column('user_id', db.Integer, nullable=False),
+    # Where the user lives now; differs from the hash until rebalance-shards moves them
+    db.Column('shard_key', db.String(50), nullable=False)
+)
+
+GLOBAL_TABLES = [Plan.__table__, Discount.__table__, Broadcast.__table__]
+
+REBALANCE_CHUNK_SIZE = 1000
+
+
+def shard_keys():
+    return shard_bind_keys(current_app)
+
+
+def user_shard_key(user_id):
+    """Shard holding user_id, or None when unsharded"""
+    keys = shard_keys()
+    return shard_key_for_user(user_id, keys) if keys else None
+
+
+def each_shard():
+    """Return every shard key, or [None] when unsharded, for loops that wrap use_shard()"""
+    return shard_keys() or [None]
+
+
+def scatter_gather(fn):
+    """Run fn() once per shard in parallel and return the results in shard order
+
+    Each call gets its own app context and session, so fn should return plain
+    data rather than ORM instances. Unsharded apps simply call fn() once.
+    """
+    keys = shard_keys()
+    if not keys:
+        return [fn()]
+
+    app = current_app._get_current_object()
+
+    def run(key):
+        with app.app_context(), use_shard(key):
+            try:
+                return fn()
+            finally:
+                db.session.remove()
+
+    with ThreadPoolExecutor(max_workers=len(keys)) as pool:
+        return list(pool.map(run, keys))
+
+
+def shard_key_for_email(email):
+    """Find the shard holding the user with this email, or None if nobody has it"""
+    keys = shard_keys()
+    if not keys:
+        return None
+
+    row = db.session.execute(
+        select(user_emails.c.user_id, user_emails.c.shard_key).where(user_emails.c.email == email),
+        bind_arguments={'bind': db.engine}
+    ).first()
+    if row is None:
+        return None
+    return row.shard_key if row.shard_key in keys else shard_key_for_user(row.user_id, keys)
+
+
+def registered_user_ids(emails):
+    """Map each registered email to its user id with one lookup on the primary"""
+    rows = db.session.execute(
+        select(user_emails.c.email, user_emails.c.user_id).where(user_emails.c.email.in_(emails)),
+        bind_arguments={'bind': db.engine}
+    )
+    return dict(rows.all())
+
+
+def allocate_user_id(connection, email):
+    """Draw the next global user id from the sequence table on the primary"""
+    return allocate_user_ids(connection, [email])[0]
+
+
+def allocate_user_ids(connection, emails):
+    """Draw a global user id per email and claim the emails in the registry
+
+    Runs in the caller's primary transaction, so a concurrent signup with the
+    same email fails on the registry's primary key instead of landing a
+    duplicate user on another shard.
+    """
+    user_ids = [
+        connection.execute(insert(user_id_sequence)).inserted_primary_key[0]
+        for _ in emails
+    ]
+    # Only the highest row is needed to keep the sequence monotonic
+    connection.execute(delete(user_id_sequence).where(user_id_sequence.c.id < user_ids[-1]))
+    keys = shard_keys()
+    connection.execute(insert(user_emails), [
+        {'email': email, 'user_id': user_id, 'shard_key': shard_key_for_user(user_id, keys)}
+        for email, user_id in zip(emails, user_ids)
+    ])
+    return user_ids
+
+
+def seed_user_id_sequence():
+    """Move the sequence past every user id already stored on any shard"""
+    highest = max(
+        (value or 0 for value in scatter_gather(lambda: db.session.query(func.max(User.id)).scalar())),
+        default=0
+    )
+    with db.engine.begin() as connection:
+        current = connection.execute(select(func.max(user_id_sequence.c.id))).scalar() or 0
+        if highest > current:
+            connection.execute(insert(user_id_sequence).values(id=highest))
+
+
+def seed_email_registry():
+    """Register the emails of users stored before the registry existed"""
+    if not shard_keys():
+        return
+
+    total = sum(scatter_gather(lambda: db.session.query(func.count(User.id)).scalar()))
+    with db.engine.begin() as connection:
+        registered = set(connection.execute(select(user_emails.c.email)).scalars())
+        if len(registered) >= total:
+            return
+
+        pages = scatter_gather(lambda: db.session.query(User.email, User.id).all())
+        stored = sorted(
+            (user_id, email, key)
+            for key, page in zip(shard_keys(), pages) for email, user_id in page
+        )
+        missing = {}
+        # Duplicates left by the old scatter-gather check keep their lowest id
+        for user_id, email, key in stored:
+            if email not in registered and email not in missing:
+                missing[email] = {'email': email, 'user_id': user_id, 'shard_key': key}
+        if missing:
+            connection.execute(insert(user_emails), list(missing.values()))
+
+
+def create_shard_tables():
+    for key in shard_keys():
+        db.metadata.create_all(db.engines[key])
+
+
+def sync_global_tables():
+    """Copy plans, discounts and broadcasts from the primary onto every shard"""
+    keys = shard_keys()
+    if not keys:
+        return
+
+    with db.engine.connect() as primary:
+        rows = {table: primary.execute(select(table)).mappings().all() for table in GLOBAL_TABLES}
+
+    for key in keys:
+        with db.engines[key].begin() as connection:
+            for table in GLOBAL_TABLES:
+                wanted = {row['id']: dict(row) for row in rows[table]}
+                existing = set(connection.execute(select(table.c.id)).scalars())
+                for row_id in existing & wanted.keys():
+                    connection.execute(update(table).where(table.c.id == row_id).values(**wanted[row_id]))
+                if wanted.keys() - existing:
+                    connection.execute(insert(table), [wanted[row_id] for row_id in wanted.keys() - existing])
+            # Discounts and broadcasts reference plans, so stale rows go in reverse order
+            for table in reversed(GLOBAL_TABLES):
+                ids = [row['id'] for row in rows[table]]
+                connection.execute(delete(table).where(table.c.id.notin_(ids)))
+
+
+def _without_id(row):
+    values = dict(row)
+    values.pop('id', None)
+    return values
+
+
+def _child_tables():
+    # Copy order: usage points at subscriptions and audit logs at any of them
+    return [Subscription.__table__, Usage.__table__, Alert.__table__, AuditLog.__table__]
+
+
+def _unmoved_rows(connection, user_id, moved):
+    """The user's child rows on a shard whose ids are not in moved, per table"""
+    subscriptions = Subscription.__table__
+    usage = Usage.__table__
+    criteria = {
+        subscriptions: subscriptions.c.user_id == user_id,
+        usage: usage.c.subscription_id.in_(select(subscriptions.c.id).where(subscriptions.c.user_id == user_id)),
+        Alert.__table__: Alert.__table__.c.user_id == user_id,
+        AuditLog.__table__: AuditLog.__table__.c.user_id == user_id
+    }
+    return {
+        table: connection.execute(
+            select(table).where(criterion, table.c.id.notin_(moved[table]))
+        ).mappings().all()
+        for table, criterion in criteria.items()
+    }
+
+
+def _insert_keeping_ids(target, table, rows):
+    """Insert rows under their own ids where the target has them free; returns {old id: new id} for the rest"""
+    if not rows:
+        return {}
+    taken = set(target.execute(
+        select(table.c.id).where(table.c.id.in_([row['id'] for row in rows]))
+    ).scalars())
+    kept = [row for row in rows if row['id'] not in taken]
+    if kept:
+        target.execute(insert(table), kept)
+    # Inserted after the kept rows, so a renumbered alert sorts after them and a stream resume replays it
+    return {
+        row['id']: target.execute(insert(table).values(**_without_id(row))).inserted_primary_key[0]
+        for row in rows if row['id'] in taken
+    }
+
+
+def _copy_rows(target, rows, moved, new_ids):
+    subscriptions = Subscription.__table__
+    usage = Usage.__table__
+    by_name = {table.name: table for table in _child_tables()}
+    for table in _child_tables():
+        table_rows = [dict(row) for row in rows[table]]
+        for row in table_rows:
+            if table is usage:
+                row['subscription_id'] = new_ids[subscriptions].get(row['subscription_id'], row['subscription_id'])
+            elif table is AuditLog.__table__ and row['table_name'] in by_name:
+                row['record_id'] = new_ids[by_name[row['table_name']]].get(row['record_id'], row['record_id'])
+        new_ids[table].update(_insert_keeping_ids(target, table, table_rows))
+        moved[table].extend(row['id'] for row in table_rows)
+
+
+def _move_user(user_id, source_key, target_key):
+    users = User.__table__
+    moved = {table: [] for table in _child_tables()}
+    new_ids = {table: {} for table in _child_tables()}
+
+    with db.engines[source_key].connect() as source:
+        user = source.execute(select(users).where(users.c.id == user_id)).mappings().first()
+        rows = _unmoved_rows(source, user_id, moved)
+
+    with db.engines[target_key].begin() as target:
+        # A rerun after a crash finds the user already copied and only finishes the delete
+        if target.execute(select(users.c.id).where(users.c.id == user_id)).first() is None:
+            target.execute(insert(users).values(**user))
+            _copy_rows(target, rows, moved, new_ids)
+        else:
+            for table, table_rows in rows.items():
+                moved[table].extend(row['id'] for row in table_rows)
+
+    with db.engine.begin() as primary:
+        primary.execute(update(user_emails).where(user_emails.c.user_id == user_id).values(shard_key=target_key))
+
+    while True:
+        with db.engines[source_key].begin() as source:
+            # Rows written to the source since the copy are carried over before anything is deleted
+            rows = _unmoved_rows(source, user_id, moved)
+            if not any(rows.values()):
+                for table in reversed(_child_tables()):
+                    if moved[table]:
+                        source.execute(delete(table).where(table.c.id.in_(moved[table])))
+                source.execute(delete(users).where(users.c.id == user_id))
+                return
+        with db.engines[target_key].begin() as target:
+            _copy_rows(target, rows, moved, new_ids)
+
+
+def rebalance_shards(chunk_size=REBALANCE_CHUNK_SIZE, log=print):
+    """Move every user whose hash no longer maps to the shard holding them
+
+    Run after adding or removing shard binds, with the web workers stopped:
+    requests are already routed by the new shard list and would not find a
+    user that has not moved yet. Users are moved one at a time, so the tool
+    can be interrupted and started again safely. Child rows keep their ids
+    unless the target shard already uses them, and audit logs follow any
+    renumbered row.
+    """
+    keys = shard_keys()
+    users = User.__table__
+    moved = 0
+    for source_key in keys:
+        last_id = 0
+        while True:
+            with db.engines[source_key].connect() as connection:
+                user_ids = connection.execute(
+                    select(users.c.id).where(users.c.id > last_id).order_by(users.c.id).limit(chunk_size)
+                ).scalars().all()
+            if not user_ids:
+                break
+            last_id = user_ids[-1]
+            for user_id in user_ids:
+                target_key = shard_key_for_user(user_id, keys)
+                if target_key != source_key:
+                    _move_user(user_id, source_key, target_key)
+                    moved += 1
+        log(f"Rebalanced {source_key}: {moved} users moved so far")
+    return moved
+
+
+def init_sharding(app):
+    """Route each request's user-scoped queries to the acting user's shard"""
+    if not shard_bind_keys(app):
+        return
+
+    @app.before_request
+    def choose_user_shard():
+        user_id = request_user_id()
+        if user_id is not None:
+            g.shard_key = shard_key_for_user(user_id, shard_bind_keys(app))
+            return
+        data = request.get_json(silent=True)
+        if isinstance(data, dict) and data.get('email'):
+            g.shard_email = data['email']
+
+    @app.cli.command('rebalance-shards')
+    @click.option('--offline', is_flag=True, help='Confirm the web workers are stopped.')
+    def rebalance_shards_command(offline):
+        """Move users onto the shard their id hashes to."""
+        if not offline:
+            raise click.UsageError('Stop the web workers, then rerun with --offline')
+        rebalance_shards()
@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
-import api from '../../utils/api';
+import api, { userAPI } from '../../utils/api';
 
 const Alerts = () => {
   const navigate = useNavigate();
@@ -9,7 +9,35 @@ const Alerts = () => {
   const [error, setError] = useState(null);
 
   useEffect(() => {
-    fetchAlerts();
+    let source = null;
+    let closed = false;
+
+    // New alerts are pushed over SSE instead of re-polling the whole list. The stream
+    // starts after the newest fetched alert so nothing created in between is missed.
+    fetchAlerts().then((fetched) => {
+      const user = JSON.parse(localStorage.getItem('user'));
+      if (!user || closed) {
+        return;
+      }
+      // 0 still asks for a backlog when the list was empty; skip it if the fetch failed
+      const newestId = fetched
+        ? fetched.reduce((newest, alert) => Math.max(newest, alert.id), 0)
+        : undefined;
+      source = new EventSource(userAPI.alertStreamUrl(user.id, newestId));
+      source.addEventListener('alert', (event) => {
+        const alert = JSON.parse(event.data);
+        setAlerts(current => (
+          current.some(existing => existing.id === alert.id) ? current : [alert, ...current]
+        ));
+      });
+    });
+
+    return () => {
+      closed = true;
+      if (source) {
+        source.close();
+      }
+    };
   }, []);
 
   const fetchAlerts = async () => {
@@ -18,7 +46,7 @@ const Alerts = () => {
       const user = JSON.parse(localStorage.getItem('user'));
       if (!user) {
         setError('Please login to view alerts');
-        return;
+        return [];
       }
 
       const response = await api.get('/user/alerts', {
@@ -29,9 +57,9 @@ const Alerts = () => {
 
       if (response.data.success) {
         setAlerts(response.data.alerts);
-      } else {
-        setError('Failed to fetch alerts');
+        return response.data.alerts;
       }
+      setError('Failed to fetch alerts');
     } catch (err) {
       setError('Error fetching alerts: ' + (err.response?.data?.error || err.message));
     } finally {
@@ -9,10 +9,19 @@ const UserDashboard = () => {
 
   const fetchUnreadAlertsCount = async () => {
     try {
-      const response = await api.userAPI.getAlerts();
-      if (response.data && response.data.alerts) {
-        const unreadCount = response.data.alerts.filter(alert => !alert.is_read).length;
-        setUnreadAlertsCount(unreadCount);
+      const storedUser = JSON.parse(localStorage.getItem('user'));
+      if (!storedUser) {
+        return;
+      }
+
+      // The dashboard snapshot already carries the unread count
+      const response = await api.get('/user/dashboard', {
+        headers: {
+          'User-ID': storedUser.id
+        }
+      });
+      if (response.data && response.data.success) {
+        setUnreadAlertsCount(response.data.unread_alert_count);
       }
     } catch (error) {
       console.error('Error fetching alerts count:', error);
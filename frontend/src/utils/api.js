@@ -1,9 +1,11 @@
 import axios from 'axios';
 
-const API_BASE_URL = 'http://localhost:5001';
+export const API_BASE_URL = 'http://localhost:5001';
 
 const api = axios.create({
   baseURL: API_BASE_URL,
+  // Keeps the backend's recent-write cookie so reads after a write skip lagging replicas
+  withCredentials: true,
   headers: {
     'Content-Type': 'application/json',
   },
@@ -20,14 +22,26 @@ export const adminAPI = {
   getPlans: () => 
     api.get('/admin/plans'),
   
+  migratePlan: (planId, targetPlanId, adminId) => 
+    api.post(`/admin/plans/${planId}/migrate`, { target_plan_id: targetPlanId }, { headers: { 'User-ID': adminId } }),
+  
+  broadcastAlert: (title, message, planId, adminId) => 
+    api.post('/admin/alerts/broadcast', { title, message, plan_id: planId }, { headers: { 'User-ID': adminId } }),
+  
+  getJob: (jobId, adminId) => 
+    api.get(`/admin/jobs/${jobId}`, { headers: { 'User-ID': adminId } }),
+  
+  cancelJob: (jobId, adminId) => 
+    api.post(`/admin/jobs/${jobId}/cancel`, {}, { headers: { 'User-ID': adminId } }),
+  
   getDiscounts: () => 
     api.get('/admin/discounts'),
   
   getUsers: () => 
     api.get('/admin/users'),
   
-  getAnalytics: () => 
-    api.get('/admin/analytics'),
+  getAnalytics: (adminId) => 
+    api.get('/admin/analytics', { headers: { 'User-ID': adminId } }),
 };
 
 // User API calls
@@ -38,8 +52,8 @@ export const userAPI = {
   login: (email, password) => 
     api.post('/user/login', { email, password }),
   
-  getDashboard: () => 
-    api.get('/user/dashboard'),
+  getDashboard: (userId) => 
+    api.get('/user/dashboard', { headers: { 'User-ID': userId } }),
   
   getSubscriptions: () => 
     api.get('/user/subscriptions'),
@@ -72,6 +86,11 @@ export const userAPI = {
   getAlerts: (userId) => 
     api.get('/user/alerts', { headers: { 'User-ID': userId } }),
   
+  // Open with new EventSource(); browsers resend Last-Event-ID on reconnect
+  alertStreamUrl: (userId, lastEventId) => 
+    `${API_BASE_URL}/user/alerts/stream?user_id=${userId}` +
+    (lastEventId != null ? `&last_event_id=${lastEventId}` : ''),
+  
   markAlertRead: (userId, alertId) => 
     api.put(`/user/alerts/${alertId}/read`, {}, { headers: { 'User-ID': userId } }),
 };